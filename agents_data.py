@@ -36,14 +36,16 @@ def _load_agents() -> List[Agent]:
     return agents
 
 # ===== 既存モード =====
+# 各関数は rng（random.Random）を受け取れる。同じ seed の rng を渡せば同じ結果になる。
 
-def get_default_agents() -> List[str]:
+def get_default_agents(rng: random.Random | None = None) -> List[str]:
     """
     デフォルトモード：
     - ロール 1〜4 からそれぞれ1人ずつ
     - さらに全体から1人
     合計5人、重複なしでランダム。
     """
+    rng = rng or random.Random()
     agents = _load_agents()
     if not agents:
         return []
@@ -55,37 +57,39 @@ def get_default_agents() -> List[str]:
     for role in range(1, 5):
         candidates = [a for a in agents if a.role == role and a.id not in used_ids]
         if candidates:
-            picked = random.choice(candidates)
+            picked = rng.choice(candidates)
             result.append(picked.name_ja)
             used_ids.add(picked.id)
 
     # 全体から1人
     remaining = [a for a in agents if a.id not in used_ids]
     if remaining:
-        picked = random.choice(remaining)
+        picked = rng.choice(remaining)
         result.append(picked.name_ja)
         used_ids.add(picked.id)
 
-    random.shuffle(result)
+    rng.shuffle(result)
     return result[:5]
 
-def get_chaos_agents() -> List[str]:
+def get_chaos_agents(rng: random.Random | None = None) -> List[str]:
     """カオスモード：ロール無視で全体から 5 人ランダム。"""
+    rng = rng or random.Random()
     agents = _load_agents()
     if not agents:
         return []
     if len(agents) <= 5:
-        random.shuffle(agents)
+        rng.shuffle(agents)
         return [a.name_ja for a in agents]
-    return [a.name_ja for a in random.sample(agents, 5)]
+    return [a.name_ja for a in rng.sample(agents, 5)]
 
-def get_hirano_agents() -> List[str]:
+def get_hirano_agents(rng: random.Random | None = None) -> List[str]:
     """
     平野流モード：
     - コントローラー(ROLE_CONTROLLER) を少なくとも 1 人
     - 残りはその他から 4 人
     合計5人。
     """
+    rng = rng or random.Random()
     agents = _load_agents()
     if not agents:
         return []
@@ -98,14 +102,14 @@ def get_hirano_agents() -> List[str]:
 
     # コントローラー 1人
     if controllers:
-        ctrl = random.choice(controllers)
+        ctrl = rng.choice(controllers)
         result.append(ctrl.name_ja)
         used_ids.add(ctrl.id)
 
     # 残り枠数
     remaining_slots = 5 - len(result)
     if remaining_slots <= 0:
-        random.shuffle(result)
+        rng.shuffle(result)
         return result[:5]
 
     # その他から残りを選ぶ
@@ -113,20 +117,31 @@ def get_hirano_agents() -> List[str]:
     if len(candidates) <= remaining_slots:
         result.extend(a.name_ja for a in candidates)
     else:
-        result.extend(a.name_ja for a in random.sample(candidates, remaining_slots))
+        result.extend(a.name_ja for a in rng.sample(candidates, remaining_slots))
 
-    random.shuffle(result)
+    rng.shuffle(result)
     return result[:5]
 
-def get_ban_agents(count: int = 2) -> List[str]:
+def get_ban_agents(count: int = 2, rng: random.Random | None = None) -> List[str]:
     """
     ピック禁止祭（BAN ルーレット）用。
     有効なエージェントから count 人分 BAN を返す。
     """
+    rng = rng or random.Random()
     agents = _load_agents()
     if not agents:
         return []
 
     count = max(1, min(count, len(agents)))
-    banned = random.sample(agents, count)
+    banned = rng.sample(agents, count)
     return [a.name_ja for a in banned]
+
+def split_teams(names: List[str], team_count: int, rng: random.Random | None = None) -> List[List[str]]:
+    """
+    メンバーを 1 回シャッフルし、team_count チームに配り分ける。
+    人数差は最大 1 人。
+    """
+    rng = rng or random.Random()
+    shuffled = list(names)
+    rng.shuffle(shuffled)
+    return [shuffled[i::team_count] for i in range(team_count)]
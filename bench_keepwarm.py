@@ -0,0 +1,86 @@
+"""
+keep-warm の効果を計測する: python bench_keepwarm.py [接続確立の遅延秒]
+
+ローカルの http.server を Groq の代わりに立て、keep-warm の有無で初回リクエストの遅延を比べる。
+本物の DNS/TLS の代わりに、接続ごとに handler.setup で指定秒だけ待たせる。
+"""
+import os
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# commands.ai は import 時にクライアントを作るのでダミーのキーを入れておく
+os.environ.setdefault("GROQ_API_KEY", "stub")
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+from openai import OpenAI
+
+from commands import ai
+from offline_ai import generate_offline
+
+CONNECT_DELAY = float(sys.argv[1]) if len(sys.argv) > 1 else 0.1
+
+MODELS_BODY = json.dumps({"object": "list", "data": []}).encode()
+CHAT_BODY = json.dumps({
+    "id": "stub",
+    "object": "chat.completion",
+    "created": 0,
+    "model": ai.MODEL_MAP[1][1],
+    "choices": [{
+        "index": 0,
+        "message": {"role": "assistant", "content": generate_offline("tactic", False, None)},
+        "finish_reason": "stop",
+    }],
+    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+}, ensure_ascii=False).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive を効かせる
+
+    def setup(self):
+        time.sleep(CONNECT_DELAY)
+        super().setup()
+
+    def _reply(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        body = MODELS_BODY if self.path.endswith("/models") else CHAT_BODY
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+def first_request(warm: bool) -> float:
+    # 毎回まっさらな接続プールから始める
+    ai.http_client.close()
+    ai.http_client = ai._make_http_client()
+    ai.groq_client = OpenAI(api_key=ai.GROQ_API_KEY, base_url=ai.GROQ_BASE_URL, http_client=ai.http_client)
+    if warm:
+        ai._warm_connections()
+    started = time.perf_counter()
+    ai._call_model("tactic", False, 1, None)
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ai.GROQ_BASE_URL = f"http://127.0.0.1:{server.server_port}/v1"
+    ai.GROQ_API_KEY = "stub"
+    ai.OPENAI_API_KEY = None  # Groq だけ温める
+
+    try:
+        for warm in (False, True):
+            elapsed = first_request(warm)
+            print(f"first request {'after keep-warm' if warm else 'cold':16} {elapsed:.3f}s")
+    finally:
+        server.shutdown()
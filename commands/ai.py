@@ -1,24 +1,89 @@
 import os
+import json
 import random
+import functools
 import time
 import re
+import asyncio
+import datetime
+import importlib.util
 from collections import deque
+from typing import Callable
+
+import httpx
 
 import discord
 from discord import app_commands
 from dotenv import load_dotenv
 from openai import OpenAI, APIError, APITimeoutError, BadRequestError, RateLimitError
 
+from rng import new_seed, make_rng
+from quota import quota_tracker
+from ledger import estimate_cost
+from lifecycle import register_state
+from offline_ai import (
+    TACTIC_ROLES,
+    TACTIC_PLACES,
+    TACTIC_ACTIONS,
+    PUNISH_TARGETS,
+    PUNISH_PLACES,
+    PUNISH_ACTIONS,
+    FOCUS_POOL,
+    TEMPO_POOL,
+    TITLE_MAX_LEN,
+    generate_offline,
+)
+
 load_dotenv()
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+
+# ==============================
+# HTTP トランスポート
+# ==============================
+# 両プロバイダで 1 つの接続プールを共有し、keep-alive を長めに取る。
+# h2 パッケージが入っていれば HTTP/2 を使う。
+HTTP_HTTP2 = importlib.util.find_spec("h2") is not None
+
+
+def _make_http_client() -> httpx.Client:
+    return httpx.Client(
+        http2=HTTP_HTTP2,
+        limits=httpx.Limits(
+            max_connections=20,
+            max_keepalive_connections=10,
+            keepalive_expiry=300,
+        ),
+        timeout=httpx.Timeout(60.0, connect=5.0),
+    )
+
+http_client = _make_http_client()
+
 groq_client = OpenAI(
     api_key=GROQ_API_KEY,
-    base_url="https://api.groq.com/openai/v1",
+    base_url=GROQ_BASE_URL,
+    http_client=http_client,
+)
+openai_client = OpenAI(
+    api_key=OPENAI_API_KEY,
+    base_url=OPENAI_BASE_URL,
+    http_client=http_client,
 )
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+
+# モデル選択ごとのリクエストタイムアウト（秒）
+MODEL_TIMEOUTS = {
+    1: httpx.Timeout(15.0, connect=5.0),
+    2: httpx.Timeout(30.0, connect=5.0),
+    3: httpx.Timeout(90.0, connect=5.0),
+}
+
+# keep-warm: 利用時間帯だけ定期的に接続を温めておく（"開始-終了" の時、日付跨ぎ可）
+KEEPWARM_INTERVAL = int(os.getenv("AI_KEEPWARM_INTERVAL", "120"))
+KEEPWARM_HOURS = os.getenv("AI_KEEPWARM_HOURS", "18-2")
 
 ai_group = app_commands.Group(
     name="ai",
@@ -26,18 +91,22 @@ ai_group = app_commands.Group(
 )
 
 MODEL_CHOICES = [
+    app_commands.Choice(name="【0】 AIを使わず即答（テンプレート）", value=0),
     app_commands.Choice(name="【1】 早いが回答がおかしくなるかも（llama）", value=1),
     app_commands.Choice(name="【2】 速度も早くちょっとだけ優秀（gpt-oss）", value=2),
     app_commands.Choice(name="【3】 遅いが必ず動作し優秀（gpt）", value=3),
 ]
 
 MODEL_MAP = {
+    0: ("local", "offline-template"),
     1: ("groq", "llama-3.1-8b-instant"),
     2: ("groq", "openai/gpt-oss-120b"),
     3: ("openai", "gpt-5-mini"),
 }
+# モデル名 -> モデル番号（使用量を実際に動いたモデルへ計上するため）
+MODEL_VALUES = {model: value for value, (_, model) in MODEL_MAP.items()}
 
-TACTIC_RULES = """あなたは「VALORANT 戦術ジェネレーター」です。
+TACTIC_RULES = f"""あなたは「VALORANT 戦術ジェネレーター」です。
 ユーザーの状況に対して、1ラウンドで完結する具体的な作戦を1つ生成してください。
 
 【前提】
@@ -46,11 +115,11 @@ TACTIC_RULES = """あなたは「VALORANT 戦術ジェネレーター」です
 ・チームが即実行できる
 
 【出力形式（厳守）】
-1) タイトル: 12文字以内
+1) タイトル: {TITLE_MAX_LEN}文字以内
 2) 詳細: 1文。役割/場所/行動を必ず入れる
-   - 役割: デュエリスト/イニシエーター/センチネル/コントローラー
-   - 場所: Aサイト/Bサイト/ミッド/自陣/敵陣（ユーザーがCサイトやCサイトがあるマップを明記した場合のみCサイト可）
-   - 行動: エントリー/ピーク/スモーク/フラッシュ/設置/リテイク/守り/ローテート/牽制/待機 から1〜2個
+   - 役割: {"/".join(TACTIC_ROLES)}
+   - 場所: {"/".join(TACTIC_PLACES)}（ユーザーがCサイトやCサイトがあるマップを明記した場合のみCサイト可）
+   - 行動: {"/".join(TACTIC_ACTIONS)} から1〜2個
 3) 注意: 1文
 
 【共通ルール】
@@ -63,7 +132,7 @@ TACTIC_RULES = """あなたは「VALORANT 戦術ジェネレーター」です
 ・情報が足りない場合は必ず上の選択肢から補完して埋める
 """
 
-PUNISH_RULES = """あなたは「VALORANT 罰ゲームジェネレーター」です。
+PUNISH_RULES = f"""あなたは「VALORANT 罰ゲームジェネレーター」です。
 試合中に投稿者（または指定された人）が実行する、1ラウンドで完結する罰ゲームを1つ生成してください。
 
 【前提】
@@ -72,11 +141,11 @@ PUNISH_RULES = """あなたは「VALORANT 罰ゲームジェネレーター」
 ・チームが即実行できる
 
 【出力形式（厳守）】
-1) タイトル: 12文字以内
+1) タイトル: {TITLE_MAX_LEN}文字以内
 2) 詳細: 1文。対象/場所/行動を必ず入れる
-   - 対象: 投稿者 または 指定された人
-   - 場所: Aサイト/Bサイト/ミッド/自陣/敵陣/指定なし（ユーザーがCサイトやCサイトがあるマップを明記した場合のみCサイト可）
-   - 行動: 歩きのみ/しゃがみのみ/スキル使用禁止/スキル1回のみ/設置後はサイト内固定/リテイク時は最後尾/報告係に徹する/エコ時はゴースト固定/試合中は報告を2倍/設置役を必ず担当/リテイク時はスモーク役を担当/スキルは設置後のみ使用/撃ち合いは必ず1回引く/オペは拾わない/初動は情報取り専念
+   - 対象: {" または ".join(PUNISH_TARGETS)}
+   - 場所: {"/".join(PUNISH_PLACES)}（ユーザーがCサイトやCサイトがあるマップを明記した場合のみCサイト可）
+   - 行動: {"/".join(PUNISH_ACTIONS)}
 3) 注意: 1文
 
 【共通ルール】
@@ -99,8 +168,8 @@ LAST_TITLES = {
     "punish": deque(maxlen=10),
 }
 
-def _make_seed() -> str:
-    return f"{int(time.time()*1000)}-{random.randint(1000, 9999)}"
+def _make_seed(rng: random.Random) -> str:
+    return f"{int(time.time()*1000)}-{rng.randint(1000, 9999)}"
 
 def _extract_title(text: str) -> str | None:
     """
@@ -120,6 +189,10 @@ def _extract_title(text: str) -> str | None:
     return None
 
 def _add_banlist(mode: str, prompt: str) -> str:
+    """
+    直近タイトルの禁止リストを末尾に付ける。
+    毎回変わるので system prompt ではなく user メッセージ側に付ける。
+    """
     banned = list(LAST_TITLES.get(mode, []))[-5:]
     if not banned:
         return prompt
@@ -136,12 +209,20 @@ def _normalize_output(text: str) -> str:
     1行圧縮のときは 2) 3) の前で改行を入れる。
     """
     t = (text or "").strip()
+    # Markdown の強調・見出し・箇条書き記号を外す（**1) タイトル:** など）
+    t = re.sub(r"\*\*|__|`", "", t)
+    t = re.sub(r"(?m)^[ \t]*(?:#+|[-*・])[ \t]*(?=[1-3][)）])", "", t)
     # 1行圧縮を想定して 2) 3) の前で改行
-    t = re.sub(r"\s+(?=[2-3]\)\s)", "\n", t)
+    t = re.sub(r"\s+(?=[2-3][)）]\s*(?:詳細|注意))", "\n", t)
+    # 空行をまとめる
+    t = re.sub(r"\n[ \t]*(?:\n[ \t]*)+", "\n", t)
     # 余計なスペース整形
     t = re.sub(r"[ \t]{2,}", " ", t)
     return t.strip()
 
+class ProviderError(RuntimeError):
+    """プロバイダ側の障害（混雑・タイムアウト・API エラー）。オフライン生成で代替してよいもの。"""
+
 def _select_client(model_value: int):
     provider, model = MODEL_MAP[model_value]
     if provider == "groq":
@@ -152,55 +233,275 @@ def _select_client(model_value: int):
         return None, None, "OPENAI_API_KEY が .env にありません。"
     return openai_client, model, None
 
-def _build_system_prompt(mode: str, hard: bool) -> str:
-    if mode == "tactic":
-        prompt = TACTIC_RULES
-        if hard:
-            prompt += (
-                "\n【ハード専用ルール】"
-                "\n・2人以上の連携を必須にする"
-                "\n・同時進行の動きを必ず入れる"
-                "\n・フェイク/囮/逆サイドのいずれかを必ず含める"
-                "\n・10秒以内など短い時間制限を入れる"
-                "\n・失敗時のリスクを1文で明示する"
-            )
-        return prompt
+# ==============================
+# プロンプトレジストリ
+# ==============================
+# system prompt は (mode, hard) ごとに固定文字列にして使い回す。
+# 毎回バイト単位で同じ先頭になるので、プロバイダ側のプロンプトキャッシュが効く。
+# 直近タイトルや seed などの可変部分は user メッセージの末尾に置く。
+PROMPT_FILE = os.getenv("PROMPT_FILE", "prompts.json")
+
+HARD_RULES = {
+    "tactic": [
+        "2人以上の連携を必須にする",
+        "同時進行の動きを必ず入れる",
+        "フェイク/囮/逆サイドのいずれかを必ず含める",
+        "10秒以内など短い時間制限を入れる",
+        "失敗時のリスクを1文で明示する",
+    ],
+    "punish": [
+        "通常より厳しい制約を1つ以上入れる",
+        "行動範囲/行動回数の制限を必ず含める",
+        "短い時間制限を入れる",
+        "失敗時のリスクを1文で明示する",
+    ],
+}
 
-    prompt = PUNISH_RULES
+@functools.lru_cache(maxsize=None)
+def _load_prompt_registry() -> dict[str, dict]:
+    """
+    組み込みのルールを元に、PROMPT_FILE があればその内容で上書きする。
+    形式: {"tactic": {"rules": "...", "hard_rules": ["..."]}, "punish": {...}}
+    """
+    registry = {
+        "tactic": {"rules": TACTIC_RULES, "hard_rules": HARD_RULES["tactic"]},
+        "punish": {"rules": PUNISH_RULES, "hard_rules": HARD_RULES["punish"]},
+    }
+    if not os.path.exists(PROMPT_FILE):
+        return registry
+    try:
+        with open(PROMPT_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for mode, entry in data.items():
+            if mode in registry and isinstance(entry, dict):
+                registry[mode].update(entry)
+    except Exception as e:
+        print(f"Failed to load prompts from {PROMPT_FILE}: {e}")
+    return registry
+
+@functools.lru_cache(maxsize=None)
+def _build_system_prompt(mode: str, hard: bool) -> str:
+    entry = _load_prompt_registry()[mode]
+    prompt = entry["rules"]
     if hard:
-        prompt += (
-            "\n【ハード専用ルール】"
-            "\n・通常より厳しい制約を1つ以上入れる"
-            "\n・行動範囲/行動回数の制限を必ず含める"
-            "\n・短い時間制限を入れる"
-            "\n・失敗時のリスクを1文で明示する"
-        )
+        prompt += "\n【ハード専用ルール】" + "".join(f"\n・{rule}" for rule in entry["hard_rules"])
     return prompt
 
-def _generate(mode: str, hard: bool, model_value: int, content: str | None) -> str:
+# ==============================
+# プロンプトキャッシュのヒット率
+# ==============================
+# モデルごとの累計（入力トークン / キャッシュされた入力トークン）
+PROMPT_CACHE_STATS: dict[str, dict[str, int]] = {}
+
+def _record_cache_usage(model: str, usage) -> None:
+    """API の usage からキャッシュ済みトークン数を集計してログに出す。"""
+    if usage is None:
+        return
+    # Responses API は input_tokens、Chat Completions は prompt_tokens
+    details = getattr(usage, "input_tokens_details", None) or getattr(usage, "prompt_tokens_details", None)
+    input_tokens = getattr(usage, "input_tokens", None) or getattr(usage, "prompt_tokens", None) or 0
+    cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details else 0
+
+    stats = PROMPT_CACHE_STATS.setdefault(model, {"input": 0, "cached": 0})
+    stats["input"] += input_tokens
+    stats["cached"] += cached_tokens
+    ratio = stats["cached"] / stats["input"] if stats["input"] else 0.0
+    print(f"[ai] model={model} cached={cached_tokens}/{input_tokens} total_ratio={ratio:.1%}")
+
+# ==============================
+# 出力トークン予算
+# ==============================
+# 出力は短い 3 行なので、実測した出力トークン数の分位点から上限を決める。
+# サンプルが少ないうちは従来の上限を使う。
+DEFAULT_MAX_TOKENS = {"openai": 3000, "groq": 2000}
+BUDGET_MIN_TOKENS = 256
+BUDGET_MIN_SAMPLES = 10
+BUDGET_PERCENTILE = 0.95
+BUDGET_MARGIN = 1.5
+
+# 入力（ユーザーの content）の上限（推定トークン数）
+MAX_CONTENT_TOKENS = int(os.getenv("AI_MAX_CONTENT_TOKENS", "300"))
+
+# (model, mode, hard) -> 直近の出力トークン数
+OUTPUT_TOKEN_SAMPLES: dict[tuple[str, str, bool], deque] = {}
+
+# (model, "fixed" | "adaptive") -> 実測の累計（呼び出し回数 / 出力トークン / 推定コスト / 上限で切れた回数 / 応答時間）
+# fixed は従来の上限のまま呼んだもの（サンプルが溜まる前）、adaptive は分位点から決めた上限で呼んだもの。
+BUDGET_STATS: dict[tuple[str, str], dict[str, float]] = {}
+
+def _estimate_tokens(text: str) -> int:
+    """ざっくりしたローカル推定。ASCII は 4 文字で 1、それ以外（日本語など）は 1 文字 1 トークン。"""
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+def _truncate_content(text: str, max_tokens: int = MAX_CONTENT_TOKENS) -> str:
+    """推定トークン数が上限を超えないよう末尾を切る。"""
+    if _estimate_tokens(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if _estimate_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+def _output_budget(provider: str, model: str, mode: str, hard: bool) -> int:
+    default = DEFAULT_MAX_TOKENS[provider]
+    samples = OUTPUT_TOKEN_SAMPLES.get((model, mode, hard))
+    if not samples or len(samples) < BUDGET_MIN_SAMPLES:
+        return default
+    ordered = sorted(samples)
+    p = ordered[min(len(ordered) - 1, int(len(ordered) * BUDGET_PERCENTILE))]
+    return max(BUDGET_MIN_TOKENS, min(default, int(p * BUDGET_MARGIN)))
+
+def _record_output_tokens(
+    model: str, mode: str, hard: bool, usage, budget: int, truncated: bool, elapsed: float
+) -> None:
+    """
+    実際の出力トークン数を記録する。上限で切れた場合は上限値を記録して、
+    次回以降の予算が広がるようにする。
+    """
+    used = (getattr(usage, "output_tokens", None) or getattr(usage, "completion_tokens", None) or 0) if usage else 0
+    samples = OUTPUT_TOKEN_SAMPLES.setdefault((model, mode, hard), deque(maxlen=100))
+    samples.append(budget if truncated else used)
+
+    input_tokens = (getattr(usage, "input_tokens", None) or getattr(usage, "prompt_tokens", None) or 0) if usage else 0
+    phase = "fixed" if budget >= DEFAULT_MAX_TOKENS[MODEL_MAP[MODEL_VALUES[model]][0]] else "adaptive"
+    stats = BUDGET_STATS.setdefault(
+        (model, phase), {"calls": 0, "output": 0, "cost": 0.0, "truncated": 0, "latency": 0.0}
+    )
+    stats["calls"] += 1
+    stats["output"] += used
+    stats["cost"] += estimate_cost(model, input_tokens, used)
+    stats["truncated"] += int(truncated)
+    stats["latency"] += elapsed
+    print(
+        f"[ai] model={model} mode={mode} hard={hard} "
+        f"output={used}/{budget} truncated={truncated} latency={elapsed:.2f}s"
+    )
+    print(f"[ai] model={model} budget " + " ".join(_budget_summary(model, p) for p in ("fixed", "adaptive")))
+
+def _budget_summary(model: str, phase: str) -> str:
+    """上限の決め方ごとの実測平均（1 回あたりの出力トークン・推定コスト・応答時間、切れた率）。"""
+    stats = BUDGET_STATS.get((model, phase))
+    if not stats:
+        return f"{phase}=n/a"
+    calls = stats["calls"]
+    return (
+        f"{phase}=[calls={calls} avg_output={stats['output'] / calls:.0f} "
+        f"avg_cost=${stats['cost'] / calls:.6f} avg_latency={stats['latency'] / calls:.2f}s "
+        f"truncated={stats['truncated'] / calls:.1%}]"
+    )
+
+# ==============================
+# 出力の検証と修復
+# ==============================
+# 3 行形式を検証し、ローカルで直せなければ 1 回だけ速い/安いモデルで再生成する。
+# 【1】より安いモデルはないので、【1】はオフライン生成（0）で代替する。
+RETRY_MODEL = {1: 0, 2: 1, 3: 2}
+
+_OUTPUT_RE = re.compile(
+    r"\A1[)）]\s*タイトル[:：]\s*(?P<title>[^\n]+)\n"
+    r"2[)）]\s*詳細[:：]\s*(?P<detail>[^\n]+)\n"
+    r"3[)）]\s*注意[:：]\s*(?P<note>[^\n]+)\Z"
+)
+
+# 前置き/後書きが付いているときに 3 項目だけ拾う用
+_FIELD_RES = {
+    "title": re.compile(r"(?m)^1[)）]\s*タイトル[:：]\s*(.+)$"),
+    "detail": re.compile(r"(?m)^2[)）]\s*詳細[:：]\s*(.+)$"),
+    "note": re.compile(r"(?m)^3[)）]\s*注意[:：]\s*(.+)$"),
+}
+
+# mode -> 詳細に必ず含める語彙グループと、緩く判定するか（Cサイトはユーザー指定時のみだが検証では許可）
+# 罰ゲームの行動は長く言い換えられやすいので、2 文字ずつの一致率で判定する
+_DETAIL_VOCAB = {
+    "tactic": ((TACTIC_ROLES, False), (TACTIC_PLACES + ("Cサイト",), False), (TACTIC_ACTIONS, False)),
+    "punish": ((PUNISH_TARGETS, False), (PUNISH_PLACES + ("Cサイト",), False), (PUNISH_ACTIONS, True)),
+}
+LOOSE_MATCH_MIN_BIGRAMS = 4
+LOOSE_MATCH_RATIO = 0.5
+
+def _bigrams(text: str) -> set[str]:
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+def _contains_loosely(detail: str, word: str) -> bool:
+    """word の 2 文字組の半分以上が detail に出てくれば含むとみなす（短い語は完全一致のみ）。"""
+    grams = _bigrams(word)
+    if len(grams) < LOOSE_MATCH_MIN_BIGRAMS:
+        return False
+    return len(grams & _bigrams(detail)) / len(grams) >= LOOSE_MATCH_RATIO
+
+# モデルごとの 1 回目の検証結果（合計 / 合格）
+VALIDATION_STATS: dict[str, dict[str, int]] = {}
+
+class ValidationResult:
+    def __init__(self, ok: bool, reason: str = "", repaired: str | None = None):
+        self.ok = ok
+        self.reason = reason
+        self.repaired = repaired
+
+def _validate_output(mode: str, text: str) -> ValidationResult:
+    """
+    3 行形式（タイトル 12 文字以内、詳細に役割/場所/行動）を検証する。
+    前置きが付いている・タイトルが長いなど、3 項目を取り出せるものは
+    ローカルで整えた版を repaired に入れる（再生成しない）。
+    """
+    if not text:
+        return ValidationResult(False, "empty")
+    m = _OUTPUT_RE.match(text)
+    if m:
+        fields = {key: m.group(key).strip() for key in ("title", "detail", "note")}
+        reason = ""
+    else:
+        found = {key: pattern.search(text) for key, pattern in _FIELD_RES.items()}
+        if not all(found.values()):
+            return ValidationResult(False, "format")
+        fields = {key: match.group(1).strip() for key, match in found.items()}
+        reason = "format"
+
+    for group, loose in _DETAIL_VOCAB[mode]:
+        detail = fields["detail"]
+        if not any(word in detail or (loose and _contains_loosely(detail, word)) for word in group):
+            return ValidationResult(False, "vocabulary")
+
+    if len(fields["title"]) > TITLE_MAX_LEN:
+        reason = "title"
+    if not reason:
+        return ValidationResult(True)
+    repaired = (
+        f"1) タイトル: {fields['title'][:TITLE_MAX_LEN]}\n"
+        f"2) 詳細: {fields['detail']}\n"
+        f"3) 注意: {fields['note']}"
+    )
+    return ValidationResult(False, reason, repaired)
+
+def _record_validation(model: str, ok: bool) -> None:
+    stats = VALIDATION_STATS.setdefault(model, {"total": 0, "valid": 0})
+    stats["total"] += 1
+    stats["valid"] += int(ok)
+    print(f"[ai] model={model} first_pass_valid={stats['valid']}/{stats['total']} ({stats['valid'] / stats['total']:.1%})")
+
+def _call_model(mode: str, hard: bool, model_value: int, content: str | None) -> tuple[str, tuple[str, int, int]]:
     client, model, error = _select_client(model_value)
     if error:
         raise RuntimeError(error)
 
-    # system prompt
+    # system prompt（(mode, hard) ごとに固定）
     system_prompt = _build_system_prompt(mode, hard)
-    system_prompt = _add_banlist(mode, system_prompt)
 
     # user prompt（毎回変える：seed混入 + 重複回避の明示）
-    seed = _make_seed()
-    seed2 = _make_seed()
-    focus_pool = [
-        "情報取り",
-        "フェイク",
-        "逆サイド",
-        "ラッシュ",
-        "カウンター",
-        "遅延",
-    ]
-    tempo_pool = ["速攻", "中速", "遅め"]
-    focus = random.choice(focus_pool)
-    tempo = random.choice(tempo_pool)
-    base = (content or "おまかせで生成してください。").strip()
+    # リクエストごとの rng を使い、seed はログに残す（グローバル random は使わない）
+    request_seed = new_seed()
+    print(f"[ai] mode={mode} hard={hard} model={model} seed={request_seed}")
+    rng = make_rng(request_seed)
+    seed = _make_seed(rng)
+    seed2 = _make_seed(rng)
+    focus = rng.choice(FOCUS_POOL)
+    tempo = rng.choice(TEMPO_POOL)
+    base = _truncate_content((content or "おまかせで生成してください。").strip())
     user_content = (
         f"{base}\n"
         f"#seed:{seed}\n"
@@ -209,6 +510,11 @@ def _generate(mode: str, hard: bool, model_value: int, content: str | None) -> s
         f"#tempo:{tempo}\n"
         f"直近と同じ案は避けてください。"
     )
+    user_content = _add_banlist(mode, user_content)
+
+    provider = MODEL_MAP[model_value][0]
+    budget = _output_budget(provider, model, mode, hard)
+    started = time.perf_counter()
 
     try:
         if model.startswith("gpt-"):
@@ -220,9 +526,11 @@ def _generate(mode: str, hard: bool, model_value: int, content: str | None) -> s
                 ],
                 reasoning={"effort": "low"},
                 text={"verbosity": "low"},
-                max_output_tokens=3000,
+                max_output_tokens=budget,
+                timeout=MODEL_TIMEOUTS[model_value],
             )
             text = (response.output_text or "").strip()
+            truncated = getattr(response, "status", None) == "incomplete"
         else:
             request_kwargs = {
                 "model": model,
@@ -232,20 +540,76 @@ def _generate(mode: str, hard: bool, model_value: int, content: str | None) -> s
                 ],
             }
             request_kwargs["temperature"] = 0.7
-            request_kwargs["max_tokens"] = 2000
+            request_kwargs["max_tokens"] = budget
+            request_kwargs["timeout"] = MODEL_TIMEOUTS[model_value]
             response = client.chat.completions.create(**request_kwargs)
             text = (response.choices[0].message.content or "").strip()
-        #print(response.usage)
+            truncated = response.choices[0].finish_reason == "length"
+        usage = getattr(response, "usage", None)
+        call_usage = (
+            model,
+            (getattr(usage, "input_tokens", None) or getattr(usage, "prompt_tokens", None) or 0) if usage else 0,
+            (getattr(usage, "output_tokens", None) or getattr(usage, "completion_tokens", None) or 0) if usage else 0,
+        )
+        _record_cache_usage(model, usage)
+        _record_output_tokens(model, mode, hard, usage, budget, truncated, time.perf_counter() - started)
     except RateLimitError:
-        raise RuntimeError("混雑中です。少し待ってから再実行してください。")
+        raise ProviderError("混雑中です。少し待ってから再実行してください。")
     except APITimeoutError:
-        raise RuntimeError("タイムアウトしました。もう一度試してください。")
+        raise ProviderError("タイムアウトしました。もう一度試してください。")
     except BadRequestError:
         raise RuntimeError("入力が長すぎるか不正です。短くして試してください。")
     except APIError:
-        raise RuntimeError("APIエラーが発生しました。時間をおいて再試行してください。")
+        raise ProviderError("APIエラーが発生しました。時間をおいて再試行してください。")
 
-    text = _normalize_output(text)
+    return _normalize_output(text), call_usage
+
+def _generate(
+    mode: str,
+    hard: bool,
+    model_value: int,
+    content: str | None,
+    allow_retry: Callable[[int], bool] | None = None,
+) -> tuple[str, list[tuple[str, int, int]]]:
+    """
+    生成して形式を検証する。崩れていたらローカルで直せるものは直し、
+    直せなければ別モデルで 1 回だけ再生成する（allow_retry がそのモデルを許可した場合のみ）。
+    戻り値は (本文, API 呼び出しごとの (モデル, 入力トークン, 出力トークン))。
+    """
+    if MODEL_MAP[model_value][0] == "local":
+        return generate_offline(mode, hard, content), []
+
+    try:
+        text, call_usage = _call_model(mode, hard, model_value, content)
+    except ProviderError as exc:
+        # プロバイダが落ちている/混雑中ならオフライン生成で代替（キー未設定や入力不正はそのまま返す）
+        print(f"[ai] provider failed ({exc}); using offline generator")
+        return f"{generate_offline(mode, hard, content)}\n（AI が応答しなかったためオフライン生成です）", []
+    usages = [call_usage]
+    result = _validate_output(mode, text)
+    _record_validation(MODEL_MAP[model_value][1], result.ok)
+
+    if not result.ok and result.repaired is None:
+        retry_value = RETRY_MODEL.get(model_value)
+        if retry_value == 0:
+            print(f"[ai] invalid output ({result.reason}); using offline generator")
+            text = f"{generate_offline(mode, hard, content)}\n（AI の回答が形式どおりでなかったためオフライン生成です）"
+            result = ValidationResult(True)
+        elif retry_value is not None and allow_retry is not None and not allow_retry(retry_value):
+            print(f"[ai] invalid output ({result.reason}); model {retry_value} is over quota, not retrying")
+        elif retry_value is not None and not _select_client(retry_value)[2]:
+            print(f"[ai] invalid output ({result.reason}); retrying with model {retry_value}")
+            try:
+                retry_text, retry_usage = _call_model(mode, hard, retry_value, content)
+                usages.append(retry_usage)
+            except RuntimeError:
+                retry_text = ""
+            retry_result = _validate_output(mode, retry_text)
+            if retry_result.ok or retry_result.repaired is not None or not text:
+                text, result = retry_text, retry_result
+
+    if result.repaired is not None:
+        text = result.repaired
 
     # 履歴更新
     title = _extract_title(text)
@@ -254,13 +618,132 @@ def _generate(mode: str, hard: bool, model_value: int, content: str | None) -> s
 
     # 本文が空だったら（gpt-ossがやらかした場合の救済）
     if not text:
-        return "（本文が空でした。別モデルを試して）"
+        return "（本文が空でした。別モデルを試して）", usages
 
-    return text
+    return text, usages
+
+# ==============================
+# keep-warm
+# ==============================
+def _in_active_hours(now: datetime.datetime | None = None) -> bool:
+    try:
+        start, end = (int(h) % 24 for h in KEEPWARM_HOURS.split("-", 1))
+    except ValueError:
+        return True
+    hour = (now or datetime.datetime.now()).hour
+    if start == end:
+        return True
+    if start < end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+def _warm_connections() -> None:
+    """各プロバイダへ軽いリクエストを送り、DNS/TLS 済みの接続をプールに残す。"""
+    targets = []
+    if GROQ_API_KEY:
+        targets.append(("groq", GROQ_BASE_URL, GROQ_API_KEY))
+    if OPENAI_API_KEY:
+        targets.append(("openai", OPENAI_BASE_URL, OPENAI_API_KEY))
+    for name, base_url, api_key in targets:
+        started = time.perf_counter()
+        try:
+            http_client.get(
+                f"{base_url}/models",
+                headers={"Authorization": f"Bearer {api_key}"},
+                timeout=httpx.Timeout(10.0, connect=5.0),
+            )
+        except Exception as e:
+            # ここで落ちるとループごと止まるので、何が起きても次の周期に回す
+            print(f"[ai] keep-warm {name} failed: {e!r}")
+            continue
+        print(f"[ai] keep-warm {name} {time.perf_counter() - started:.3f}s")
+
+async def keep_warm_loop() -> None:
+    """起動直後に 1 回、以降は利用時間帯のみ KEEPWARM_INTERVAL 秒ごとに接続を温める。"""
+    await asyncio.to_thread(_warm_connections)
+    while True:
+        await asyncio.sleep(KEEPWARM_INTERVAL)
+        if _in_active_hours():
+            await asyncio.to_thread(_warm_connections)
+
+# ==============================
+# 再起動をまたぐ状態
+# ==============================
+def warm_prompt_cache() -> None:
+    """全 (mode, hard) の system prompt を先に組み立てておく。"""
+    for mode in ("tactic", "punish"):
+        for hard in (False, True):
+            _build_system_prompt(mode, hard)
+
+def _dump_ai_state() -> dict:
+    return {
+        "last_titles": {mode: list(titles) for mode, titles in LAST_TITLES.items()},
+        "output_tokens": [
+            [model, mode, hard, list(samples)]
+            for (model, mode, hard), samples in OUTPUT_TOKEN_SAMPLES.items()
+        ],
+    }
+
+def _load_ai_state(data: dict) -> None:
+    for mode, titles in data.get("last_titles", {}).items():
+        if mode in LAST_TITLES:
+            LAST_TITLES[mode].extend(titles)
+    for model, mode, hard, samples in data.get("output_tokens", []):
+        OUTPUT_TOKEN_SAMPLES.setdefault((model, mode, bool(hard)), deque(maxlen=100)).extend(samples)
+
+register_state("ai", _dump_ai_state, _load_ai_state)
 
 # ==============================
 # Commands
 # ==============================
+def _format_remaining(user: int | None, guild: int | None) -> str:
+    parts = []
+    if user is not None:
+        parts.append(f"あなた {user:,}")
+    if guild is not None:
+        parts.append(f"サーバー {guild:,}")
+    if not parts:
+        return ""
+    return f"\n-# 本日の残りトークン: {' / '.join(parts)}"
+
+async def _run(
+    interaction: discord.Interaction, mode: str, hard: bool, model_value: int, content: str | None
+) -> None:
+    """クールダウン/上限を API 呼び出し前に確認し、生成して返信する。"""
+    user_id = interaction.user.id
+    guild_id = interaction.guild_id
+    if MODEL_MAP[model_value][0] != "local":
+        rejected = quota_tracker.check(user_id, guild_id, model_value)
+        if rejected:
+            await interaction.followup.send(rejected)
+            return
+
+    try:
+        # 再試行するモデルにもクールダウン/上限を適用する
+        result, usages = await asyncio.to_thread(
+            _generate,
+            mode,
+            hard,
+            model_value,
+            content,
+            lambda retry_value: quota_tracker.check(user_id, guild_id, retry_value) is None,
+        )
+    except Exception as exc:
+        interaction.extras["ok"] = False
+        await interaction.followup.send(f"エラー: {exc}")
+        return
+
+    # 利用ログ（main.py の on_app_command_completion で記録）
+    interaction.extras["usage"] = usages
+    # 再試行で別モデルが動いた分はそのモデルに計上する
+    for model, input_tokens, output_tokens in usages:
+        used_value = MODEL_VALUES.get(model, 0)
+        if MODEL_MAP[used_value][0] != "local":
+            quota_tracker.charge(user_id, guild_id, used_value, input_tokens + output_tokens)
+    if MODEL_MAP[model_value][0] != "local":
+        result += _format_remaining(*quota_tracker.remaining(user_id, guild_id, model_value))
+    await interaction.followup.send(result)
+
 @ai_group.command(name="tactic", description="【開発中】AIによる戦術を考えてくれるモード")
 @app_commands.describe(model="使用するモデル、回答が変わったりします", content="状況や要望（例：バインド攻めで、オペが出てきて連敗中）")
 @app_commands.choices(model=MODEL_CHOICES)
@@ -270,12 +753,7 @@ async def tactic_cmd(
     content: str,
 ):
     await interaction.response.defer()
-    try:
-        result = _generate("tactic", False, model.value, content)
-    except Exception as exc:
-        await interaction.followup.send(f"エラー: {exc}")
-        return
-    await interaction.followup.send(result)
+    await _run(interaction, "tactic", False, model.value, content)
 
 @ai_group.command(name="tactic_hard", description="【開発中】AIによる戦術を考えてくれるモード（ハード）")
 @app_commands.describe(model="使用するモデル、回答が変わったりします", content="状況や要望（例：バインド攻めで、オペが出てきて連敗中）")
@@ -286,12 +764,7 @@ async def tactic_hard_cmd(
     content: str,
 ):
     await interaction.response.defer()
-    try:
-        result = _generate("tactic", True, model.value, content)
-    except Exception as exc:
-        await interaction.followup.send(f"エラー: {exc}")
-        return
-    await interaction.followup.send(result)
+    await _run(interaction, "tactic", True, model.value, content)
 
 @ai_group.command(name="punish", description="【開発中】AIによる罰ゲームを考えてくれるモード")
 @app_commands.describe(model="使用するモデル、回答が変わったりします", content="mapや使ってるキャラを入力")
@@ -302,12 +775,7 @@ async def punish_cmd(
     content: str = "おまかせ",
 ):
     await interaction.response.defer()
-    try:
-        result = _generate("punish", False, model.value, content)
-    except Exception as exc:
-        await interaction.followup.send(f"エラー: {exc}")
-        return
-    await interaction.followup.send(result)
+    await _run(interaction, "punish", False, model.value, content)
 
 @ai_group.command(name="punish_hard", description="【開発中】AIによる罰ゲームを考えてくれるモード（ハード）")
 @app_commands.describe(model="使用するモデル、回答が変わったりします", content="mapや使ってるキャラを入力")
@@ -318,9 +786,4 @@ async def punish_hard_cmd(
     content: str = "おまかせ",
 ):
     await interaction.response.defer()
-    try:
-        result = _generate("punish", True, model.value, content)
-    except Exception as exc:
-        await interaction.followup.send(f"エラー: {exc}")
-        return
-    await interaction.followup.send(result)
+    await _run(interaction, "punish", True, model.value, content)
@@ -1,16 +1,11 @@
 import os
 import json
-import random
 import discord
 from discord import app_commands
 
-from views import AgentSelectViewJa
-from agents_data import (
-    get_default_agents,
-    get_chaos_agents,
-    get_hirano_agents,
-    get_ban_agents,
-)
+from views import AgentSelectViewJa, build_agent_embed, track_agent_select
+from agents_data import get_ban_agents, split_teams
+from rng import new_seed, make_rng, record_draw, get_draw
 
 va_group = app_commands.Group(
     name="va",
@@ -23,6 +18,15 @@ MAP_FILE = os.getenv("MAP_FILE", "maps.json")
 PUNISH_FILE = os.getenv("PUNISH_FILE", "punishments.json")
 
 
+# ===== Discord Embed の上限 =====
+
+EMBED_MAX_FIELDS = 25          # 1 Embed あたりのフィールド数
+EMBED_MAX_CHARS = 6000         # 1 メッセージ内の Embed 合計文字数
+MESSAGE_MAX_EMBEDS = 10        # 1 メッセージあたりの Embed 数
+
+TEAM_MAX_COUNT = 10
+
+
 # ===== 共通ヘルパー =====
 
 def _load_json_list(path: str, key: str) -> list[str]:
@@ -37,6 +41,64 @@ def _load_json_list(path: str, key: str) -> list[str]:
         return []
 
 
+def _build_embeds(
+    title: str,
+    description: str,
+    color: discord.Color,
+    fields: list[tuple[str, str, bool]],
+    footer: str | None = None,
+) -> list[discord.Embed]:
+    """
+    フィールドを Discord の上限（25 フィールド / 6000 文字）に収まるよう
+    複数の Embed に分割する。2 枚目以降のタイトルには (2/3) のように番号を付ける。
+    """
+    footer_len = len(footer) if footer else 0
+    # タイトルの番号付け "（99/99）" 分の余裕を見ておく
+    budget = EMBED_MAX_CHARS - len(title) - len(description) - footer_len - 8
+
+    chunks: list[list[tuple[str, str, bool]]] = [[]]
+    used = 0
+    for field in fields:
+        size = len(field[0]) + len(field[1])
+        current = chunks[-1]
+        if current and (len(current) >= EMBED_MAX_FIELDS or used + size > budget):
+            chunks.append([])
+            used = 0
+        chunks[-1].append(field)
+        used += size
+
+    total = len(chunks)
+    embeds: list[discord.Embed] = []
+    for i, chunk in enumerate(chunks, start=1):
+        embed = discord.Embed(
+            title=title if total == 1 else f"{title}（{i}/{total}）",
+            description=description if i == 1 else None,
+            color=color,
+        )
+        for name, value, inline in chunk:
+            embed.add_field(name=name, value=value, inline=inline)
+        if footer and i == total:
+            embed.set_footer(text=footer)
+        embeds.append(embed)
+    return embeds
+
+
+async def _send_embeds(interaction: discord.Interaction, embeds: list[discord.Embed]) -> None:
+    """Embed を 1 メッセージの上限（10 枚 / 合計 6000 文字）ごとにまとめて最小回数で送信する。"""
+    batch: list[discord.Embed] = []
+    used = 0
+    for embed in embeds:
+        size = len(embed)
+        if batch and (len(batch) >= MESSAGE_MAX_EMBEDS or used + size > EMBED_MAX_CHARS):
+            await interaction.followup.send(embeds=batch)
+            batch = []
+            used = 0
+        batch.append(embed)
+        used += size
+    if batch:
+        await interaction.followup.send(embeds=batch)
+
+
 # ===== 既存：エージェントランダム =====
 
 @va_group.command(name="random", description="ランダムでエージェント構成を決めます。")
@@ -56,50 +118,44 @@ async def random_cmd(interaction: discord.Interaction):
         color=discord.Color.blue(),
     )
 
-    await interaction.followup.send(
+    message = await interaction.followup.send(
         embed=embed,
         view=AgentSelectViewJa(),
         ephemeral=False,
     )
+    track_agent_select(message.id)
 
 
 # ===== ② マップランダム =====
 
-@va_group.command(name="random_map", description="ランダムでマップを1つ選びます。")
-async def random_map_cmd(interaction: discord.Interaction):
-    await interaction.response.defer()
-
+def _render_map(seed: int) -> list[discord.Embed] | str:
     maps = _load_json_list(MAP_FILE, "maps")
     if not maps:
-        await interaction.followup.send("マップ一覧が空、または読み込みに失敗しました。`maps.json` を確認してください。")
-        return
+        return "マップ一覧が空、または読み込みに失敗しました。`maps.json` を確認してください。"
 
-    chosen = random.choice(maps)
+    chosen = make_rng(seed).choice(maps)
 
     embed = discord.Embed(
         title="本日のマップは…",
         description=f"🎲 ランダムに選ばれたマップは **{chosen}** です！",
         color=discord.Color.green(),
     )
+    embed.set_footer(text=f"seed: {seed}")
+    return [embed]
 
-    await interaction.followup.send(embed=embed)
 
-
-# ===== ③ ピック禁止祭（BAN ルーレット） =====
-
-@va_group.command(name="ban", description="ピック禁止エージェントをランダムで決めます。")
-@app_commands.describe(count="BAN するエージェント数（1〜5、未指定は2）")
-async def ban_cmd(interaction: discord.Interaction, count: int | None = 2):
+@va_group.command(name="random_map", description="ランダムでマップを1つ選びます。")
+async def random_map_cmd(interaction: discord.Interaction):
     await interaction.response.defer()
+    await _run_draw(interaction, "random_map")
 
-    if count is None:
-        count = 2
-    count = max(1, min(count, 5))
 
-    banned = get_ban_agents(count)
+# ===== ③ ピック禁止祭（BAN ルーレット） =====
+
+def _render_ban(seed: int, count: int) -> list[discord.Embed] | str:
+    banned = get_ban_agents(count, make_rng(seed))
     if not banned:
-        await interaction.followup.send("エージェント一覧が空です。`agents.json` を確認してください。")
-        return
+        return "エージェント一覧が空です。`agents.json` を確認してください。"
 
     banned_list = "\n".join(f"- {name}" for name in banned)
 
@@ -108,58 +164,132 @@ async def ban_cmd(interaction: discord.Interaction, count: int | None = 2):
         description=f"この試合で **ピック禁止** になったエージェントは：\n\n{banned_list}",
         color=discord.Color.red(),
     )
-    embed.set_footer(text="※ 罰ゲーム用のローカルルールなどと組み合わせて使ってね。")
+    embed.set_footer(text=f"※ 罰ゲーム用のローカルルールなどと組み合わせて使ってね。 / seed: {seed}")
+    return [embed]
 
-    await interaction.followup.send(embed=embed)
 
+@va_group.command(name="ban", description="ピック禁止エージェントをランダムで決めます。")
+@app_commands.describe(count="BAN するエージェント数（1〜5、未指定は2）")
+async def ban_cmd(interaction: discord.Interaction, count: int | None = 2):
+    await interaction.response.defer()
 
-# ===== ⑤ 罰ゲームルーレット（VC全員・一人ずつ違う） =====
+    if count is None:
+        count = 2
+    count = max(1, min(count, 5))
 
-@va_group.command(name="punish", description="VCメンバー全員に罰ゲームを割り当てます。")
-async def punish_cmd(interaction: discord.Interaction):
-    await interaction.response.defer()
+    await _run_draw(interaction, "ban", count=count)
 
-    if not (interaction.user.voice and interaction.user.voice.channel):
-        await interaction.followup.send("VC に参加してから `/va punish` を実行してください。")
-        return
 
-    members = [m for m in interaction.user.voice.channel.members if not m.bot]
-    if not members:
-        await interaction.followup.send("VC に人がいません。（Bot は除外しています）")
-        return
+# ===== ⑤ 罰ゲームルーレット（VC全員・一人ずつ違う） =====
 
+def _render_punish(seed: int, names: list[str]) -> list[discord.Embed] | str:
     punish_list = _load_json_list(PUNISH_FILE, "punishments")
     if not punish_list:
-        await interaction.followup.send("罰ゲームリストが空、または読み込みに失敗しました。`punishments.json` を確認してください。")
-        return
+        return "罰ゲームリストが空、または読み込みに失敗しました。`punishments.json` を確認してください。"
+
+    rng = make_rng(seed)
 
     # メンバー人数に応じて罰ゲームを用意する
-    random.shuffle(punish_list)
+    rng.shuffle(punish_list)
 
-    if len(punish_list) >= len(members):
-        selected = random.sample(punish_list, len(members))
+    if len(punish_list) >= len(names):
+        selected = rng.sample(punish_list, len(names))
     else:
         # 足りない場合はローテーションして被りを許容
         selected = []
         idx = 0
-        while len(selected) < len(members):
+        while len(selected) < len(names):
             selected.append(punish_list[idx % len(punish_list)])
             idx += 1
 
-    embed = discord.Embed(
-        title="罰ゲームルーレット",
-        description="VC にいる全員に罰ゲームを割り当てました。",
-        color=discord.Color.purple(),
+    fields = [(name, punish, False) for name, punish in zip(names, selected)]
+    return _build_embeds(
+        "罰ゲームルーレット",
+        "VC にいる全員に罰ゲームを割り当てました。",
+        discord.Color.purple(),
+        fields,
+        footer=f"seed: {seed}",
     )
 
-    for member, punish in zip(members, selected):
-        embed.add_field(name=member.display_name, value=punish, inline=False)
 
-    await interaction.followup.send(embed=embed)
+@va_group.command(name="punish", description="VCメンバー全員に罰ゲームを割り当てます。")
+async def punish_cmd(interaction: discord.Interaction):
+    await interaction.response.defer()
+
+    if not (interaction.user.voice and interaction.user.voice.channel):
+        await interaction.followup.send("VC に参加してから `/va punish` を実行してください。")
+        return
+
+    members = [m for m in interaction.user.voice.channel.members if not m.bot]
+    if not members:
+        await interaction.followup.send("VC に人がいません。（Bot は除外しています）")
+        return
+
+    await _run_draw(interaction, "punish", names=[m.display_name for m in members])
 
 
 # ===== ⑥ 役職シャッフル =====
 
+# 5つの固定ロール（順番も意味を持たせる）
+ROLE_DEFS = [
+    {
+        "title": "IGL（作戦コール担当）",
+        "short": "IGL",
+        "sentence": "この試合のIGLは **{name}** です！ 全ラウンドの作戦コールをお願いします。"
+    },
+    {
+        "title": "エントリー担当",
+        "short": "エントリー",
+        "sentence": "この試合のエントリー担当は **{name}** です！ サイトに入る先頭をお願いします。"
+    },
+    {
+        "title": "スパイク担当",
+        "short": "スパイク",
+        "sentence": "この試合のスパイク担当は **{name}** です！ スパイクの管理と設置をお願いします。"
+    },
+    {
+        "title": "オペレーター担当",
+        "short": "オペ",
+        "sentence": "この試合のオペレーター担当は **{name}** です！ お金に余裕があるラウンドではオペを優先してください。"
+    },
+    {
+        "title": "情報共有係",
+        "short": "情報共有",
+        "sentence": "この試合の情報共有係は **{name}** です！ 敵位置や音の情報を積極的にコールしてください。"
+    },
+]
+
+FREE_ROLE_SENTENCE = "この試合は役職なし（自由枠）です。好きに暴れてください。"
+
+
+def _team_name(index: int) -> str:
+    return f"チーム{chr(ord('A') + index)}"
+
+
+def _render_role_shuffle(seed: int, names: list[str]) -> list[discord.Embed] | str:
+    names = list(names)
+    make_rng(seed).shuffle(names)  # 誰にどの役職が行くかシャッフル
+
+    fields: list[tuple[str, str, bool]] = []
+
+    # 5つの役職を、最大5人まで被りなしで割り当て
+    for name, role_def in zip(names, ROLE_DEFS):
+        text = role_def["sentence"].format(name=name)
+        fields.append((role_def["title"], text, False))
+
+    # 6人目以降は「役職なし（自由枠）」
+    for name in names[len(ROLE_DEFS):]:
+        fields.append((name, FREE_ROLE_SENTENCE, False))
+
+    return _build_embeds(
+        "役職シャッフル",
+        "この試合の役職担当は以下の通りです！",
+        discord.Color.blue(),
+        fields,
+        footer=f"seed: {seed}",
+    )
+
+
 @va_group.command(name="role_shuffle", description="VCメンバーに5つの役職を割り当てます。")
 async def role_shuffle_cmd(interaction: discord.Interaction):
     await interaction.response.defer()
@@ -175,93 +305,110 @@ async def role_shuffle_cmd(interaction: discord.Interaction):
         await interaction.followup.send("VC に人がいません。（Bot は除外しています）")
         return
 
-    # 5つの固定ロール（順番も意味を持たせる）
-    role_defs = [
-        {
-            "title": "IGL（作戦コール担当）",
-            "sentence": "この試合のIGLは **{name}** です！ 全ラウンドの作戦コールをお願いします。"
-        },
-        {
-            "title": "エントリー担当",
-            "sentence": "この試合のエントリー担当は **{name}** です！ サイトに入る先頭をお願いします。"
-        },
-        {
-            "title": "スパイク担当",
-            "sentence": "この試合のスパイク担当は **{name}** です！ スパイクの管理と設置をお願いします。"
-        },
-        {
-            "title": "オペレーター担当",
-            "sentence": "この試合のオペレーター担当は **{name}** です！ お金に余裕があるラウンドではオペを優先してください。"
-        },
-        {
-            "title": "情報共有係",
-            "sentence": "この試合の情報共有係は **{name}** です！ 敵位置や音の情報を積極的にコールしてください。"
-        },
-    ]
-
-    random.shuffle(members)  # 誰にどの役職が行くかシャッフル
-
-    embed = discord.Embed(
-        title="役職シャッフル",
-        description="この試合の役職担当は以下の通りです！",
-        color=discord.Color.blue(),
-    )
+    await _run_draw(interaction, "role_shuffle", names=[m.display_name for m in members])
 
-    # 5つの役職を、最大5人まで被りなしで割り当て
-    max_roles = min(5, len(members))
-    for i in range(max_roles):
-        member = members[i]
-        role_def = role_defs[i]
-        text = role_def["sentence"].format(name=member.display_name)
-        embed.add_field(name=role_def["title"], value=text, inline=False)
 
-    # 6人目以降は「役職なし（自由枠）」
-    if len(members) > 5:
-        for member in members[5:]:
-            embed.add_field(
-                name=member.display_name,
-                value="この試合は役職なし（自由枠）です。好きに暴れてください。",
-                inline=False,
-            )
+# ===== ⑧ チーム分けランダム（Nチーム） =====
 
-    await interaction.followup.send(embed=embed)
+def _render_teams(seed: int, names: list[str], count: int, roles: bool) -> list[discord.Embed] | str:
+    teams = split_teams(names, count, make_rng(seed))
 
+    def format_team(team_names: list[str]) -> str:
+        if not team_names:
+            return "（なし）"
+        lines = []
+        for i, name in enumerate(team_names):
+            if roles and i < len(ROLE_DEFS):
+                lines.append(f"- {name}（{ROLE_DEFS[i]['short']}）")
+            else:
+                lines.append(f"- {name}")
+        return "\n".join(lines)
+
+    fields = [(_team_name(i), format_team(team), True) for i, team in enumerate(teams)]
+    return _build_embeds(
+        "チーム分けランダム",
+        f"VC メンバーを {count} チームにランダムで分けました。",
+        discord.Color.teal(),
+        fields,
+        footer=f"seed: {seed}",
+    )
 
-# ===== ⑧ チーム分けランダム（2チーム） =====
 
-@va_group.command(name="teams", description="VCメンバーを2チームにランダムで分けます。")
-async def teams_cmd(interaction: discord.Interaction):
+@va_group.command(name="teams", description="VCメンバーをランダムでチーム分けします。")
+@app_commands.describe(
+    count=f"チーム数（2〜{TEAM_MAX_COUNT}、未指定は2）",
+    roles="チームごとに役職も割り当てる",
+)
+async def teams_cmd(interaction: discord.Interaction, count: int | None = 2, roles: bool = False):
     await interaction.response.defer()
 
     if not (interaction.user.voice and interaction.user.voice.channel):
         await interaction.followup.send("VC に参加してから `/va teams` を実行してください。")
         return
 
+    if count is None:
+        count = 2
+    count = max(2, min(count, TEAM_MAX_COUNT))
+
     members = [m for m in interaction.user.voice.channel.members if not m.bot]
-    if len(members) < 2:
-        await interaction.followup.send("チーム分けするには最低 2 人必要です。")
+    if len(members) < count:
+        await interaction.followup.send(f"{count} チームに分けるには最低 {count} 人必要です。")
         return
 
-    random.shuffle(members)
-    mid = len(members) // 2
-    team_a = members[:mid]
-    team_b = members[mid:]
-
-    embed = discord.Embed(
-        title="チーム分けランダム",
-        description="VC メンバーを 2 チームにランダムで分けました。",
-        color=discord.Color.teal(),
+    await _run_draw(
+        interaction,
+        "teams",
+        names=[m.display_name for m in members],
+        count=count,
+        roles=roles,
     )
 
-    def format_team(team_members: list[discord.Member]) -> str:
-        if not team_members:
-            return "（なし）"
-        return "\n".join(f"- {m.display_name}" for m in team_members)
 
-    embed.add_field(name="チームA", value=format_team(team_a), inline=True)
-    embed.add_field(name="チームB", value=format_team(team_b), inline=True)
+# ===== リプレイ（seed から抽選を再現） =====
 
-    await interaction.followup.send(embed=embed)
+# コマンド名 -> Embed 生成関数（seed + 記録した入力で同じ結果を返す）
+DRAW_RENDERERS = {
+    "random_map": _render_map,
+    "ban": _render_ban,
+    "punish": _render_punish,
+    "role_shuffle": _render_role_shuffle,
+    "teams": _render_teams,
+}
+
+
+async def _run_draw(interaction: discord.Interaction, command: str, **params) -> None:
+    """seed を払い出して抽選し、再現用に記録してから送信する。"""
+    seed = new_seed()
+    result = DRAW_RENDERERS[command](seed, **params)
+    if isinstance(result, str):
+        await interaction.followup.send(result)
+        return
+    record_draw(seed, command, **params)
+    await _send_embeds(interaction, result)
+
+
+@va_group.command(name="replay", description="seed を指定して過去の抽選結果を再現します。")
+@app_commands.describe(seed="結果の下に表示されている seed")
+async def replay_cmd(interaction: discord.Interaction, seed: int):
+    await interaction.response.defer()
+
+    record = get_draw(seed)
+    if record is None:
+        await interaction.followup.send(f"seed `{seed}` の抽選記録が見つかりません。")
+        return
+
+    command, params = record
+    if command == "random":
+        embed = build_agent_embed(params["mode"], params["user_names"], seed)
+        result = [embed] if embed else "無効なモードが記録されています。"
+    else:
+        result = DRAW_RENDERERS[command](seed, **params)
+
+    if isinstance(result, str):
+        await interaction.followup.send(result)
+        return
+    await interaction.followup.send(f"🔁 `/va {command}` の抽選（seed: {seed}）を再現しました。")
+    await _send_embeds(interaction, result)
 
 
 # ===== ヘルプ =====
@@ -281,8 +428,10 @@ async def help_cmd(interaction: discord.Interaction):
         "VC にいるメンバー全員に、それぞれ別の罰ゲームを割り当てます。\n\n"
         "**/va role_shuffle**\n"
         "VC メンバーに役職をランダムで割り当てます。\n\n"
-        "**/va teams**\n"
-        "VC メンバーを 2 チームにランダムで分けます。\n"
+        "**/va teams [count] [roles]**\n"
+        "VC メンバーを count チーム（未指定は 2）にランダムで分けます。roles を有効にするとチームごとに役職も割り当てます。\n\n"
+        "**/va replay <seed>**\n"
+        "結果の下に表示されている seed から、同じ抽選結果を再現します。\n"
     )
 
     await interaction.followup.send(text)
@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import datetime
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List
+
+# ==============================
+# 設定（.env で上書き可）
+# ==============================
+LEDGER_DIR = os.getenv("LEDGER_DIR", "ledger")
+LEDGER_MAX_BYTES = int(os.getenv("LEDGER_MAX_BYTES", str(10 * 1024 * 1024)))
+LEDGER_FLUSH_INTERVAL = float(os.getenv("LEDGER_FLUSH_INTERVAL", "5"))
+LEDGER_BATCH_SIZE = 500
+
+# モデルごとの料金（USD / 100万トークン、入力・出力）
+MODEL_PRICES = {
+    "llama-3.1-8b-instant": (0.05, 0.08),
+    "openai/gpt-oss-120b": (0.15, 0.75),
+    "gpt-5-mini": (0.25, 2.00),
+}
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    price_in, price_out = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (input_tokens * price_in + output_tokens * price_out) / 1_000_000
+
+
+class Ledger:
+    """
+    追記専用のイベントログ（JSONL）。
+    record() はメモリに積むだけで、書き込みは flush() でまとめて行う（イベントループ外で呼ぶ）。
+    LEDGER_BATCH_SIZE 件溜まったら batch_ready を立てて、書き出しループを待たずに起こす。
+    ファイルが LEDGER_MAX_BYTES を超えたら新しいセグメントに切り替える。
+    """
+
+    def __init__(self, directory: str = LEDGER_DIR, max_bytes: int = LEDGER_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.pending: List[Dict[str, Any]] = []
+        self.lock = threading.Lock()
+        self.path: str | None = None
+        self.batch_ready = asyncio.Event()
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+    def record(self, command: str, **fields: Any) -> None:
+        event = {"ts": round(time.time(), 3), "command": command}
+        event.update(fields)
+        with self.lock:
+            self.pending.append(event)
+            full = len(self.pending) >= LEDGER_BATCH_SIZE
+        if full and self.loop is not None:
+            # スレッドから呼ばれても安全なようにループ経由で立てる
+            self.loop.call_soon_threadsafe(self.batch_ready.set)
+
+    def _segment_path(self) -> str:
+        if self.path and os.path.exists(self.path) and os.path.getsize(self.path) < self.max_bytes:
+            return self.path
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.path = os.path.join(self.directory, f"events-{stamp}-{os.getpid()}.jsonl")
+        return self.path
+
+    def flush(self) -> int:
+        with self.lock:
+            batch, self.pending = self.pending, []
+        if not batch:
+            return 0
+        lines = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in batch)
+        try:
+            with open(self._segment_path(), "a", encoding="utf-8") as f:
+                f.write(lines)
+        except OSError as e:
+            print(f"Failed to write ledger: {e}")
+            with self.lock:
+                self.pending[:0] = batch
+            return 0
+        return len(batch)
+
+
+ledger = Ledger()
+
+
+def record_interaction(interaction, command_name: str, ok: bool) -> None:
+    """
+    インタラクション 1 回分の利用ログを積む。
+    遅延は Discord がインタラクションを作った時刻からの経過。
+    AI の使用量は interaction.extras["usage"] に (モデル, 入力, 出力) のリストで入れておく。
+    """
+    latency_ms = (datetime.datetime.now(datetime.timezone.utc) - interaction.created_at).total_seconds() * 1000
+    usage = interaction.extras.get("usage", [])
+    ledger.record(
+        command_name,
+        guild_id=interaction.guild_id,
+        user_id=interaction.user.id,
+        latency_ms=round(latency_ms, 1),
+        ok=ok and interaction.extras.get("ok", True),
+        usage=usage,
+        cost_usd=round(sum(estimate_cost(*u) for u in usage), 6),
+    )
+
+
+async def ledger_flush_loop() -> None:
+    """LEDGER_FLUSH_INTERVAL 秒ごと（LEDGER_BATCH_SIZE 件溜まればすぐ）にスレッドで書き出す。"""
+    ledger.loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await asyncio.wait_for(ledger.batch_ready.wait(), LEDGER_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        ledger.batch_ready.clear()
+        await asyncio.to_thread(ledger.flush)
+
+
+# ==============================
+# 集計 CLI: python ledger.py [ディレクトリ]
+# ==============================
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def _read_events(directory: str):
+    if not os.path.isdir(directory):
+        return
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".jsonl"):
+            continue
+        with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+
+
+def report(directory: str = LEDGER_DIR) -> str:
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    guild_cost: Dict[str, float] = defaultdict(float)
+    model_tokens: Dict[str, List[int]] = defaultdict(lambda: [0, 0, 0])
+    first_ts = last_ts = None
+
+    for e in _read_events(directory):
+        ts = e.get("ts", 0)
+        first_ts = ts if first_ts is None else min(first_ts, ts)
+        last_ts = ts if last_ts is None else max(last_ts, ts)
+        command = e.get("command", "?")
+        latencies[command].append(float(e.get("latency_ms", 0)))
+        if not e.get("ok", True):
+            errors[command] += 1
+        guild_cost[str(e.get("guild_id"))] += float(e.get("cost_usd", 0))
+        for model, input_tokens, output_tokens in e.get("usage", []):
+            stats = model_tokens[model]
+            stats[0] += 1
+            stats[1] += input_tokens
+            stats[2] += output_tokens
+
+    if first_ts is None:
+        return f"イベントがありません（{directory}）"
+
+    hours = max((last_ts - first_ts) / 3600, 1 / 60)
+    lines = [f"期間: {time.strftime('%Y-%m-%d %H:%M', time.localtime(first_ts))}"
+             f" 〜 {time.strftime('%Y-%m-%d %H:%M', time.localtime(last_ts))}", ""]
+
+    lines.append(f"{'command':<20}{'count':>8}{'/hour':>9}{'err':>6}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}")
+    for command, values in sorted(latencies.items(), key=lambda kv: -len(kv[1])):
+        lines.append(
+            f"{command:<20}{len(values):>8}{len(values) / hours:>9.1f}{errors[command]:>6}"
+            f"{_percentile(values, 0.5):>9.0f}{_percentile(values, 0.95):>9.0f}{_percentile(values, 0.99):>9.0f}"
+        )
+
+    lines += ["", f"{'model':<24}{'calls':>8}{'input':>12}{'output':>12}{'cost$':>10}"]
+    for model, (calls, input_tokens, output_tokens) in sorted(model_tokens.items()):
+        lines.append(
+            f"{model:<24}{calls:>8}{input_tokens:>12}{output_tokens:>12}"
+            f"{estimate_cost(model, input_tokens, output_tokens):>10.4f}"
+        )
+
+    lines += ["", f"{'guild':<24}{'cost$':>10}"]
+    for guild, cost in sorted(guild_cost.items(), key=lambda kv: -kv[1]):
+        lines.append(f"{guild:<24}{cost:>10.4f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(report(sys.argv[1] if len(sys.argv) > 1 else LEDGER_DIR))
@@ -0,0 +1,107 @@
+import os
+import json
+import asyncio
+from typing import Any, Callable, Dict, Tuple
+
+# ==============================
+# 設定（.env で上書き可）
+# ==============================
+STATE_FILE = os.getenv("STATE_FILE", "state.json")
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "30"))
+
+# ==============================
+# 状態の保存/復元
+# ==============================
+# 名前 -> (dump, load)。各モジュールが自分の状態を登録する。
+_STATE_HANDLERS: Dict[str, Tuple[Callable[[], Any], Callable[[Any], None]]] = {}
+
+
+def register_state(name: str, dump: Callable[[], Any], load: Callable[[Any], None]) -> None:
+    """再起動をまたいで残したい状態を登録する。dump は JSON にできる値を返すこと。"""
+    _STATE_HANDLERS[name] = (dump, load)
+
+
+def save_state(path: str = STATE_FILE) -> None:
+    data = {}
+    for name, (dump, _) in _STATE_HANDLERS.items():
+        try:
+            data[name] = dump()
+        except Exception as e:
+            print(f"Failed to dump state {name}: {e}")
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Failed to save state to {path}: {e}")
+        return
+    print(f"[lifecycle] saved state: {', '.join(data)}")
+
+
+def load_state(path: str = STATE_FILE) -> None:
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"Failed to load state from {path}: {e}")
+        return
+    for name, value in data.items():
+        handler = _STATE_HANDLERS.get(name)
+        if handler is None:
+            continue
+        try:
+            handler[1](value)
+        except Exception as e:
+            print(f"Failed to restore state {name}: {e}")
+    print(f"[lifecycle] restored state: {', '.join(n for n in data if n in _STATE_HANDLERS)}")
+
+
+# ==============================
+# ドレイン（新規受付を止めて実行中の処理を待つ）
+# ==============================
+DRAINING_MESSAGE = "メンテナンスのため再起動中です。少し待ってから再実行してください。"
+
+_draining = False
+# 受付済みで未完了のインタラクション ID
+_inflight: set[int] = set()
+_idle: asyncio.Event | None = None
+
+
+def is_draining() -> bool:
+    return _draining
+
+
+def _idle_event() -> asyncio.Event:
+    global _idle
+    if _idle is None:
+        _idle = asyncio.Event()
+        _idle.set()
+    return _idle
+
+
+def begin_interaction(interaction_id: int) -> None:
+    """受付した時点（defer より前）から実行中として数える。"""
+    _inflight.add(interaction_id)
+    _idle_event().clear()
+
+
+def end_interaction(interaction_id: int) -> None:
+    _inflight.discard(interaction_id)
+    if not _inflight:
+        _idle_event().set()
+
+
+async def drain(timeout: float = DRAIN_TIMEOUT) -> bool:
+    """新規受付を止め、実行中の処理が終わるのを最大 timeout 秒待つ。全部終われば True。"""
+    global _draining
+    _draining = True
+    print(f"[lifecycle] draining ({len(_inflight)} in flight, timeout {timeout:.0f}s)")
+    try:
+        await asyncio.wait_for(_idle_event().wait(), timeout)
+    except asyncio.TimeoutError:
+        print(f"[lifecycle] drain timed out with {len(_inflight)} in flight")
+        return False
+    return True
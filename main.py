@@ -1,4 +1,6 @@
 import os
+import signal
+import traceback
 import asyncio
 
 import discord
@@ -6,7 +8,19 @@ from discord.ext import commands
 from dotenv import load_dotenv
 
 from commands.va import va_group
-from commands.ai import ai_group
+from commands.ai import ai_group, keep_warm_loop, warm_prompt_cache
+from quota import quota_tracker, quota_flush_loop
+from ledger import ledger, ledger_flush_loop, record_interaction
+from views import restore_agent_selects
+from lifecycle import (
+    load_state,
+    save_state,
+    drain,
+    is_draining,
+    begin_interaction,
+    end_interaction,
+    DRAINING_MESSAGE,
+)
 
 load_dotenv()
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
@@ -21,12 +35,41 @@ intents.guilds = True
 intents.members = True        # 開発者ポータルで「SERVER MEMBERS INTENT」を有効化しておく
 intents.voice_states = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+class DrainAwareTree(discord.app_commands.CommandTree):
+    """
+    ドレイン中は新しいコマンドを受け付けない。
+    受け付けたコマンドは完了/エラーまで実行中として数える（ドレインはこれを待つ）。
+    """
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if is_draining():
+            await interaction.response.send_message(DRAINING_MESSAGE, ephemeral=True)
+            return False
+        begin_interaction(interaction.id)
+        return True
+
+bot = commands.Bot(command_prefix="!", intents=intents, tree_cls=DrainAwareTree)
+# setup_hook で起動する定期タスク（ログイン前に止められても参照できるよう先に用意する）
+bot.background_tasks = []
+bot.shutdown_task = None
+bot.drain_task = None
 
 async def setup_hook():
     bot.tree.add_command(va_group)
     bot.tree.add_command(ai_group)
     print("va_group commands registered successfully.")
+    # 前回の終了時に保存した状態を戻し、キャッシュを温めてから受付を始める
+    load_state()
+    quota_tracker.load()
+    warm_prompt_cache()
+    restored = restore_agent_selects(bot)
+    if restored:
+        print(f"Restored {restored} agent select views.")
+    bot.background_tasks += [
+        asyncio.create_task(keep_warm_loop()),
+        asyncio.create_task(quota_flush_loop()),
+        asyncio.create_task(ledger_flush_loop()),
+    ]
 
 bot.setup_hook = setup_hook
 
@@ -39,9 +82,63 @@ async def on_ready():
     except Exception as e:
         print(f"Error syncing commands: {e}")
 
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    end_interaction(interaction.id)
+    record_interaction(interaction, command.qualified_name, ok=True)
+
+@bot.tree.error
+async def on_app_command_error(interaction: discord.Interaction, error: discord.app_commands.AppCommandError):
+    command_name = interaction.command.qualified_name if interaction.command else "unknown"
+    print(f"Error in command {command_name}: {error}")
+    traceback.print_exception(error)
+    end_interaction(interaction.id)
+    record_interaction(interaction, command_name, ok=False)
+
+def _persist() -> None:
+    """ログ・利用枠・状態をディスクに書き出す。"""
+    ledger.flush()
+    quota_tracker.flush()
+    save_state()
+
+async def shutdown(sig_name: str) -> None:
+    """新規受付を止め、実行中の生成を待ってから状態を保存して終了する。"""
+    print(f"Received {sig_name}, shutting down...")
+    try:
+        # 2 回目のシグナルで打ち切れるよう、ドレインは別タスクで待つ
+        bot.drain_task = asyncio.create_task(drain())
+        await asyncio.wait([bot.drain_task])
+        # 定期書き出しと _persist が同時に走らないよう先に止める
+        for task in bot.background_tasks:
+            task.cancel()
+        await asyncio.gather(*bot.background_tasks, return_exceptions=True)
+        await asyncio.to_thread(_persist)
+    finally:
+        await bot.close()
+
+def _on_signal(sig: signal.Signals) -> None:
+    # タスクの参照を持っておかないとドレイン中に GC されることがある
+    if bot.shutdown_task is None:
+        bot.shutdown_task = asyncio.create_task(shutdown(sig.name))
+    elif bot.drain_task is not None and not bot.drain_task.done():
+        print(f"Received {sig.name} again, skipping drain")
+        bot.drain_task.cancel()
+
 async def main():
-    async with bot:
-        await bot.start(DISCORD_TOKEN)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, _on_signal, sig)
+        except (NotImplementedError, AttributeError):
+            # Windows などシグナルハンドラが使えない環境では終了時の保存だけ行う
+            pass
+
+    try:
+        async with bot:
+            await bot.start(DISCORD_TOKEN)
+    finally:
+        if not is_draining():
+            _persist()
 
 if __name__ == "__main__":
     asyncio.run(main())
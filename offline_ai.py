@@ -0,0 +1,207 @@
+import os
+import re
+import json
+import time
+import random
+import functools
+from typing import Any, Dict, List, Tuple
+
+from agents_data import AGENT_FILE
+
+MAP_FILE = os.getenv("MAP_FILE", "maps.json")
+PUNISH_FILE = os.getenv("PUNISH_FILE", "punishments.json")
+
+# ==============================
+# 出力の語彙（プロンプト・検証・オフライン生成で共通）
+# ==============================
+TACTIC_ROLES = ("デュエリスト", "イニシエーター", "センチネル", "コントローラー")
+TACTIC_PLACES = ("Aサイト", "Bサイト", "ミッド", "自陣", "敵陣")
+TACTIC_ACTIONS = ("エントリー", "ピーク", "スモーク", "フラッシュ", "設置", "リテイク", "守り", "ローテート", "牽制", "待機")
+
+PUNISH_TARGETS = ("投稿者", "指定された人")
+PUNISH_PLACES = ("Aサイト", "Bサイト", "ミッド", "自陣", "敵陣", "指定なし")
+PUNISH_ACTIONS = (
+    "歩きのみ", "しゃがみのみ", "スキル使用禁止", "スキル1回のみ", "設置後はサイト内固定",
+    "リテイク時は最後尾", "報告係に徹する", "エコ時はゴースト固定", "試合中は報告を2倍",
+    "設置役を必ず担当", "リテイク時はスモーク役を担当", "スキルは設置後のみ使用",
+    "撃ち合いは必ず1回引く", "オペは拾わない", "初動は情報取り専念",
+)
+
+FOCUS_POOL = (
+    "情報取り",
+    "フェイク",
+    "逆サイド",
+    "ラッシュ",
+    "カウンター",
+    "遅延",
+)
+TEMPO_POOL = ("速攻", "中速", "遅め")
+
+TITLE_MAX_LEN = 12
+
+# ==============================
+# テンプレート
+# ==============================
+TACTIC_NOTES = (
+    "単独で先行しない。",
+    "スキルを使い切る前に撃ち合わない。",
+    "人数不利なら無理に当たらない。",
+    "味方の合図を待ってから動く。",
+    "設置前に必ず周囲をクリアする。",
+)
+TACTIC_HARD_NOTES = (
+    "失敗すると人数不利のまま設置できなくなる。",
+    "タイミングがずれると各個撃破される。",
+    "囮が早く倒れると本命のサイトが割れる。",
+)
+# ハードの追加制限と、同じ要素を縛る行動に含まれる語（含まれていたらその制限は使わない）
+PUNISH_HARD_EXTRAS = (
+    ("スキルは1回までとする", "スキル"),
+    ("報告はチャットのみとする", "報告"),
+    ("購入はピストルのみとする", "ゴースト"),
+    ("ジャンプは禁止とする", "しゃがみ"),
+)
+PUNISH_NOTES = (
+    "チームの邪魔になる動きはしない。",
+    "守れなかったら次のラウンドもやり直し。",
+    "ラウンド開始時に宣言してから始める。",
+    "味方に迷惑をかけない範囲で守る。",
+)
+
+_BRACKET_RE = re.compile(r"【([^】]+)】")
+
+
+@functools.lru_cache(maxsize=8)
+def _load_json(path: str, mtime_ns: int) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _load_cached(path: str) -> Dict[str, Any]:
+    """ファイルの更新時刻ごとにキャッシュして読む（編集は次回呼び出しで反映）。"""
+    try:
+        return _load_json(path, os.stat(path).st_mtime_ns)
+    except Exception as e:
+        print(f"Failed to load {path}: {e}")
+        return {}
+
+
+def _mentioned_maps(content: str) -> List[str]:
+    return [m for m in _load_cached(MAP_FILE).get("maps", []) if isinstance(m, str) and m in content]
+
+
+def _mentioned_agents(content: str) -> List[Tuple[str, int]]:
+    agents = _load_cached(AGENT_FILE).get("agents", [])
+    return [
+        (a.get("name_ja", ""), int(a.get("role", 0)))
+        for a in agents
+        if a.get("enabled", True) and a.get("name_ja") and a["name_ja"] in content
+    ]
+
+
+def _punish_labels() -> Tuple[str, ...]:
+    """punishments.json の【】内（罰ゲーム名）を取り出す。"""
+    try:
+        return _parse_punish_labels(PUNISH_FILE, os.stat(PUNISH_FILE).st_mtime_ns)
+    except OSError:
+        return ()
+
+
+@functools.lru_cache(maxsize=8)
+def _parse_punish_labels(path: str, mtime_ns: int) -> Tuple[str, ...]:
+    labels = []
+    for item in _load_cached(path).get("punishments", []):
+        if isinstance(item, str):
+            m = _BRACKET_RE.search(item)
+            if m:
+                labels.append(m.group(1))
+    return tuple(labels)
+
+
+def _title(text: str) -> str:
+    return text[:TITLE_MAX_LEN]
+
+
+def _tactic(hard: bool, content: str, rng: random.Random) -> str:
+    places = TACTIC_PLACES + (("Cサイト",) if "Cサイト" in content else ())
+    place, other_place = rng.sample(places, 2)
+    action, action2 = rng.sample(TACTIC_ACTIONS, 2)
+    tempo = rng.choice(TEMPO_POOL)
+
+    # ユーザーが書いたエージェント/マップだけ使う
+    agents = _mentioned_agents(content)
+    rng.shuffle(agents)
+    actors = [f"{name}（{TACTIC_ROLES[role - 1]}）" for name, role in agents if 1 <= role <= len(TACTIC_ROLES)]
+    actors += rng.sample(TACTIC_ROLES, 2)
+    actor, actor2 = actors[0], actors[1]
+
+    maps = _mentioned_maps(content)
+    place_text = f"{maps[0]}の{place}" if maps else place
+
+    title = _title(f"{tempo}{place}{action}")
+    if hard:
+        detail = (
+            f"10秒以内に{actor}が{place_text}で{action}し、"
+            f"同時に{actor2}が{other_place}で{action2}して囮になる。"
+        )
+        note = rng.choice(TACTIC_HARD_NOTES)
+    else:
+        detail = f"{actor}が{place_text}で{action}し、{actor2}が{action2}で続く。"
+        note = rng.choice(TACTIC_NOTES)
+    return f"1) タイトル: {title}\n2) 詳細: {detail}\n3) 注意: {note}"
+
+
+def _punish(hard: bool, content: str, rng: random.Random) -> str:
+    places = PUNISH_PLACES + (("Cサイト",) if "Cサイト" in content else ())
+    place = rng.choice(places)
+    action = rng.choice(PUNISH_ACTIONS)
+    target = rng.choice(PUNISH_TARGETS)
+
+    agents = _mentioned_agents(content)
+    if agents:
+        target = f"{rng.choice(agents)[0]}を使う{target}"
+
+    maps = _mentioned_maps(content)
+    if place == "指定なし":
+        place_text = "場所指定なしで"
+    else:
+        place_text = f"{maps[0]}の{place}で" if maps else f"{place}で"
+
+    title = _title(f"{action}の刑" if len(action) + 2 <= TITLE_MAX_LEN else action)
+    if hard:
+        extras = [extra for extra, conflict in PUNISH_HARD_EXTRAS if conflict not in action]
+        detail = f"{target}は{place_text}30秒間{action}、{rng.choice(extras)}。"
+        labels = _punish_labels()
+        note = f"失敗したら次のラウンドは【{rng.choice(labels)}】。" if labels else "失敗したら次のラウンドも継続する。"
+    else:
+        detail = f"{target}は{place_text}{action}で1ラウンドを過ごす。"
+        note = rng.choice(PUNISH_NOTES)
+    return f"1) タイトル: {title}\n2) 詳細: {detail}\n3) 注意: {note}"
+
+
+def generate_offline(mode: str, hard: bool, content: str | None, rng: random.Random | None = None) -> str:
+    """
+    API を使わずにテンプレートから 3 行形式の戦術/罰ゲームを作る。
+    プロバイダが落ちているときの代替や、モデル【0】で使う。
+    """
+    rng = rng or random.Random()
+    content = content or ""
+    if mode == "tactic":
+        return _tactic(hard, content, rng)
+    return _punish(hard, content, rng)
+
+
+if __name__ == "__main__":
+    # ベンチマーク: python offline_ai.py [回数]
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = random.Random(0)
+    for mode in ("tactic", "punish"):
+        for hard in (False, True):
+            started = time.perf_counter()
+            for _ in range(n):
+                generate_offline(mode, hard, "アセントでジェットを使用", rng)
+            elapsed = time.perf_counter() - started
+            print(f"{mode:6} hard={hard!s:5} {n / elapsed:,.0f} gen/s ({elapsed / n * 1e6:.1f} us/gen)")
+    print(generate_offline("tactic", True, "アセントでジェットを使用", random.Random(1)))
@@ -0,0 +1,210 @@
+import os
+import json
+import asyncio
+import time
+import sqlite3
+import threading
+from typing import Dict, Tuple
+
+# ==============================
+# 設定（.env で上書き可）
+# ==============================
+QUOTA_DB = os.getenv("QUOTA_DB", "quota.db")
+QUOTA_FLUSH_INTERVAL = int(os.getenv("QUOTA_FLUSH_INTERVAL", "60"))
+
+# 1 日 = 24 個の 1 時間バケットのスライディングウィンドウ
+WINDOW_BUCKETS = 24
+BUCKET_SECONDS = 3600
+
+
+def _parse_model_map(value: str, default: Dict[int, int]) -> Dict[int, int]:
+    """"1:5,2:10,3:30" 形式をモデル番号 -> 値の dict にする。"""
+    if not value:
+        return dict(default)
+    result = dict(default)
+    for part in value.split(","):
+        try:
+            k, v = part.split(":", 1)
+            result[int(k)] = int(v)
+        except ValueError:
+            print(f"Invalid quota setting: {part}")
+    return result
+
+
+# モデルごとのクールダウン（秒）。ユーザー単位とサーバー単位
+COOLDOWN_SECONDS = _parse_model_map(os.getenv("AI_COOLDOWN_SECONDS", ""), {1: 5, 2: 10, 3: 30})
+GUILD_COOLDOWN_SECONDS = _parse_model_map(os.getenv("AI_GUILD_COOLDOWN_SECONDS", ""), {1: 1, 2: 2, 3: 5})
+# モデルごとの 1 日あたりトークン上限（0 以下なら無制限）
+USER_DAILY_TOKENS = _parse_model_map(os.getenv("AI_USER_DAILY_TOKENS", ""), {1: 50000, 2: 30000, 3: 10000})
+GUILD_DAILY_TOKENS = _parse_model_map(os.getenv("AI_GUILD_DAILY_TOKENS", ""), {1: 500000, 2: 300000, 3: 100000})
+
+
+class SlidingWindow:
+    """
+    固定長のリングバッファで直近 24 時間の合計を持つ。
+    加算・参照ともに O(1)（経過したバケットだけ捨てる）。
+    """
+
+    __slots__ = ("buckets", "head", "total")
+
+    def __init__(self, buckets: list[int] | None = None, head: int = 0):
+        self.buckets = buckets or [0] * WINDOW_BUCKETS
+        self.head = head  # 最新バケットの通し番号（epoch 秒 // BUCKET_SECONDS）
+        self.total = sum(self.buckets)
+
+    def _advance(self, now: float) -> None:
+        current = int(now // BUCKET_SECONDS)
+        steps = current - self.head
+        if steps <= 0:
+            return
+        for i in range(1, min(steps, WINDOW_BUCKETS) + 1):
+            idx = (self.head + i) % WINDOW_BUCKETS
+            self.total -= self.buckets[idx]
+            self.buckets[idx] = 0
+        self.head = current
+
+    def add(self, amount: int, now: float) -> None:
+        self._advance(now)
+        self.buckets[self.head % WINDOW_BUCKETS] += amount
+        self.total += amount
+
+    def used(self, now: float) -> int:
+        self._advance(now)
+        return self.total
+
+
+class QuotaTracker:
+    """
+    ユーザー/サーバー/モデルごとのクールダウンと日次トークン上限。
+    メモリ上で管理し、定期的に SQLite へ書き出す（クールダウンは保存しない）。
+    """
+
+    def __init__(self, db_path: str = QUOTA_DB):
+        self.db_path = db_path
+        self.windows: Dict[Tuple[str, int, int], SlidingWindow] = {}
+        self.last_used: Dict[Tuple[str, int, int], float] = {}
+        self.lock = threading.Lock()
+
+    # ----- 判定 -----
+
+    def check(self, user_id: int, guild_id: int | None, model: int, now: float | None = None) -> str | None:
+        """
+        実行できるならクールダウンを開始して None、できないなら理由を返す。
+        上流 API を呼ぶ前に使う。
+        """
+        now = now or time.time()
+        with self.lock:
+            wait = self._cooldown_left("user", user_id, model, now)
+            if wait:
+                return f"クールダウン中です。あと {wait:.0f} 秒待ってください。"
+            if guild_id is not None:
+                wait = self._cooldown_left("guild", guild_id, model, now)
+                if wait:
+                    return f"サーバー全体でクールダウン中です。あと {wait:.0f} 秒待ってください。"
+
+            if self._remaining("user", user_id, model, now) == 0:
+                return "本日のトークン上限に達しました（ユーザー）。別のモデルを使うか、時間をおいてください。"
+            if guild_id is not None and self._remaining("guild", guild_id, model, now) == 0:
+                return "本日のトークン上限に達しました（サーバー）。別のモデルを使うか、時間をおいてください。"
+
+            self.last_used[("user", user_id, model)] = now
+            if guild_id is not None:
+                self.last_used[("guild", guild_id, model)] = now
+            return None
+
+    def charge(self, user_id: int, guild_id: int | None, model: int, tokens: int, now: float | None = None) -> None:
+        now = now or time.time()
+        with self.lock:
+            self._window("user", user_id, model).add(tokens, now)
+            if guild_id is not None:
+                self._window("guild", guild_id, model).add(tokens, now)
+
+    def remaining(self, user_id: int, guild_id: int | None, model: int) -> Tuple[int | None, int | None]:
+        """(ユーザー残り, サーバー残り)。上限なしは None。"""
+        now = time.time()
+        with self.lock:
+            user = self._remaining("user", user_id, model, now)
+            guild = self._remaining("guild", guild_id, model, now) if guild_id is not None else None
+        return user, guild
+
+    def _cooldown_left(self, scope: str, key: int, model: int, now: float) -> float:
+        cooldown = (COOLDOWN_SECONDS if scope == "user" else GUILD_COOLDOWN_SECONDS).get(model, 0)
+        last = self.last_used.get((scope, key, model))
+        if last is None or now - last >= cooldown:
+            return 0
+        return cooldown - (now - last)
+
+    def _window(self, scope: str, key: int, model: int) -> SlidingWindow:
+        window = self.windows.get((scope, key, model))
+        if window is None:
+            window = self.windows[(scope, key, model)] = SlidingWindow()
+        return window
+
+    def _remaining(self, scope: str, key: int, model: int, now: float) -> int | None:
+        limit = (USER_DAILY_TOKENS if scope == "user" else GUILD_DAILY_TOKENS).get(model, 0)
+        if limit <= 0:
+            return None
+        window = self.windows.get((scope, key, model))
+        used = window.used(now) if window else 0
+        return max(0, limit - used)
+
+    # ----- 永続化 -----
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS quota ("
+            "scope TEXT, key INTEGER, model INTEGER, head INTEGER, buckets TEXT, "
+            "PRIMARY KEY (scope, key, model))"
+        )
+        return conn
+
+    def load(self) -> None:
+        if not os.path.exists(self.db_path):
+            return
+        try:
+            conn = self._connect()
+            with conn:
+                rows = conn.execute("SELECT scope, key, model, head, buckets FROM quota").fetchall()
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"Failed to load quota from {self.db_path}: {e}")
+            return
+        with self.lock:
+            for scope, key, model, head, buckets in rows:
+                self.windows[(scope, key, model)] = SlidingWindow(json.loads(buckets), head)
+        print(f"[quota] loaded {len(rows)} windows from {self.db_path}")
+
+    def flush(self) -> None:
+        now = time.time()
+        with self.lock:
+            rows = []
+            for (scope, key, model), window in list(self.windows.items()):
+                if window.used(now) == 0:
+                    # 24 時間使われていないものは捨てる
+                    del self.windows[(scope, key, model)]
+                    continue
+                rows.append((scope, key, model, window.head, json.dumps(window.buckets)))
+            # クールダウンが明けたものも捨てる
+            max_cooldown = max([*COOLDOWN_SECONDS.values(), *GUILD_COOLDOWN_SECONDS.values()], default=0)
+            for k, last in list(self.last_used.items()):
+                if now - last >= max_cooldown:
+                    del self.last_used[k]
+        try:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM quota")
+                conn.executemany("INSERT INTO quota VALUES (?, ?, ?, ?, ?)", rows)
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"Failed to flush quota to {self.db_path}: {e}")
+
+
+quota_tracker = QuotaTracker()
+
+
+async def quota_flush_loop() -> None:
+    """QUOTA_FLUSH_INTERVAL 秒ごとに書き出す（読み込みは受付開始前に setup_hook で行う）。"""
+    while True:
+        await asyncio.sleep(QUOTA_FLUSH_INTERVAL)
+        await asyncio.to_thread(quota_tracker.flush)
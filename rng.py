@@ -0,0 +1,51 @@
+import os
+import random
+import secrets
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from lifecycle import register_state
+
+# 直近の抽選を seed で引けるように保持する件数
+DRAW_HISTORY_SIZE = int(os.getenv("DRAW_HISTORY_SIZE", "500"))
+
+# seed -> (コマンド名, 抽選に使った入力)
+DRAW_HISTORY: "OrderedDict[int, Tuple[str, Dict[str, Any]]]" = OrderedDict()
+
+
+def new_seed() -> int:
+    """リクエストごとの seed を払い出す（32bit 整数、表示・入力しやすい長さ）。"""
+    return secrets.randbits(32)
+
+
+def make_rng(seed: int) -> random.Random:
+    """seed から独立した乱数生成器を作る。グローバルの random は共有しない。"""
+    return random.Random(seed)
+
+
+def record_draw(seed: int, command: str, **params: Any) -> None:
+    """
+    抽選結果を再現できるよう、seed とコマンド・入力を記録する。
+    古いものから捨てる。
+    """
+    print(f"[draw] command={command} seed={seed}")
+    DRAW_HISTORY[seed] = (command, params)
+    DRAW_HISTORY.move_to_end(seed)
+    while len(DRAW_HISTORY) > DRAW_HISTORY_SIZE:
+        DRAW_HISTORY.popitem(last=False)
+
+
+def get_draw(seed: int) -> Tuple[str, Dict[str, Any]] | None:
+    return DRAW_HISTORY.get(seed)
+
+
+def _dump_history() -> List[list]:
+    return [[seed, command, params] for seed, (command, params) in DRAW_HISTORY.items()]
+
+
+def _load_history(data: List[list]) -> None:
+    for seed, command, params in data[-DRAW_HISTORY_SIZE:]:
+        DRAW_HISTORY[int(seed)] = (command, params)
+
+
+register_state("draw_history", _dump_history, _load_history)
@@ -0,0 +1,31 @@
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ロールごとに 3 人ずつ、計 12 人の小さなエージェント一覧
+FIXTURE_AGENTS = {
+    "roles": {"1": "デュエリスト", "2": "イニシエーター", "3": "センチネル", "4": "コントローラー"},
+    "agents": [
+        {"id": f"r{role}a{i}", "name_ja": f"ロール{role}-{i}", "role": role, "enabled": True}
+        for role in range(1, 5)
+        for i in range(3)
+    ]
+    + [{"id": "disabled", "name_ja": "無効", "role": 4, "enabled": False}],
+}
+
+
+@pytest.fixture
+def agent_file(tmp_path, monkeypatch):
+    import agents_data
+    import offline_ai
+
+    path = tmp_path / "agents.json"
+    path.write_text(json.dumps(FIXTURE_AGENTS, ensure_ascii=False), encoding="utf-8")
+    monkeypatch.setattr(agents_data, "AGENT_FILE", str(path))
+    # offline_ai は import 時に値をコピーしているので別に差し替える
+    monkeypatch.setattr(offline_ai, "AGENT_FILE", str(path))
+    return path
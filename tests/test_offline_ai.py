@@ -0,0 +1,51 @@
+import json
+import random
+
+import pytest
+
+import offline_ai
+
+
+@pytest.fixture
+def offline_files(agent_file, tmp_path, monkeypatch):
+    maps = tmp_path / "maps.json"
+    maps.write_text(json.dumps({"maps": ["アセント"]}, ensure_ascii=False), encoding="utf-8")
+    punishments = tmp_path / "punishments.json"
+    punishments.write_text(
+        json.dumps({"punishments": ["【ナイフ縛り】ナイフだけで戦う"]}, ensure_ascii=False), encoding="utf-8"
+    )
+    monkeypatch.setattr(offline_ai, "MAP_FILE", str(maps))
+    monkeypatch.setattr(offline_ai, "PUNISH_FILE", str(punishments))
+
+
+@pytest.fixture
+def ai(monkeypatch):
+    # commands.ai は import 時に API クライアントを作るのでダミーのキーを入れる
+    monkeypatch.setenv("GROQ_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    pytest.importorskip("discord")
+    pytest.importorskip("openai")
+    return pytest.importorskip("commands.ai")
+
+
+# ===== ハード罰ゲームの追加制限が行動と矛盾しない =====
+
+def test_hard_punish_extra_does_not_conflict(offline_files):
+    for seed in range(200):
+        detail = offline_ai.generate_offline("punish", True, "", random.Random(seed)).splitlines()[1]
+        action, extra = detail.split("30秒間", 1)[1].split("、", 1)
+        for restriction, conflict in offline_ai.PUNISH_HARD_EXTRAS:
+            if restriction in extra:
+                assert conflict not in action
+
+
+# ===== オフライン生成は AI の出力と同じ検証を通る =====
+
+@pytest.mark.parametrize("mode", ["tactic", "punish"])
+@pytest.mark.parametrize("hard", [False, True])
+@pytest.mark.parametrize("content", ["", "アセントでロール1-0を使用", "Cサイトでロール4-2"])
+def test_offline_output_passes_validation(offline_files, ai, mode, hard, content):
+    for seed in range(200):
+        text = offline_ai.generate_offline(mode, hard, content, random.Random(seed))
+        result = ai._validate_output(mode, text)
+        assert result.ok, (seed, result.reason, text)
@@ -0,0 +1,117 @@
+import time
+import random
+
+import pytest
+
+import rng
+import agents_data
+from agents_data import (
+    ROLE_CONTROLLER,
+    get_default_agents,
+    get_chaos_agents,
+    get_hirano_agents,
+    get_ban_agents,
+    split_teams,
+)
+
+
+def _roles_by_name():
+    return {a.name_ja: a.role for a in agents_data._load_agents()}
+
+
+# ===== seed 固定で結果が再現できる =====
+
+@pytest.mark.parametrize(
+    "picker",
+    [get_default_agents, get_chaos_agents, get_hirano_agents, lambda rng: get_ban_agents(3, rng)],
+)
+def test_same_seed_same_result(agent_file, picker):
+    for seed in range(20):
+        assert picker(random.Random(seed)) == picker(random.Random(seed))
+
+
+def test_pinned_results(agent_file):
+    """seed 1 の結果を固定しておく（抽選ロジックを変えたら気付けるように）。"""
+    assert get_default_agents(random.Random(1)) == ["ロール1-0", "ロール3-0", "ロール2-2", "ロール1-2", "ロール4-1"]
+    assert get_chaos_agents(random.Random(1)) == ["ロール1-2", "ロール4-0", "ロール1-1", "ロール2-1", "ロール4-1"]
+    assert get_hirano_agents(random.Random(1)) == ["ロール4-0", "ロール1-1", "ロール4-1", "ロール4-2", "ロール2-1"]
+    assert get_ban_agents(2, random.Random(1)) == ["ロール1-2", "ロール4-0"]
+
+
+# ===== モードごとのルール =====
+
+def test_default_one_per_role_plus_free(agent_file):
+    roles = _roles_by_name()
+    for seed in range(200):
+        picked = get_default_agents(random.Random(seed))
+        assert len(picked) == 5
+        assert len(set(picked)) == 5
+        counts = [sum(1 for name in picked if roles[name] == role) for role in range(1, 5)]
+        assert all(c >= 1 for c in counts)
+        assert sorted(counts) == [1, 1, 1, 2]
+
+
+def test_chaos_five_unique(agent_file):
+    for seed in range(200):
+        picked = get_chaos_agents(random.Random(seed))
+        assert len(picked) == 5
+        assert len(set(picked)) == 5
+
+
+def test_hirano_has_controller(agent_file):
+    roles = _roles_by_name()
+    for seed in range(200):
+        picked = get_hirano_agents(random.Random(seed))
+        assert len(picked) == 5
+        assert len(set(picked)) == 5
+        assert any(roles[name] == ROLE_CONTROLLER for name in picked)
+
+
+def test_ban_unique_and_clamped(agent_file):
+    for seed in range(50):
+        banned = get_ban_agents(4, random.Random(seed))
+        assert len(banned) == len(set(banned)) == 4
+    assert len(get_ban_agents(100, random.Random(0))) == 12
+    assert "無効" not in get_ban_agents(100, random.Random(0))
+
+
+# ===== チーム分け =====
+
+@pytest.mark.parametrize("people,teams", [(2, 2), (5, 2), (10, 3), (27, 4), (30, 10)])
+def test_split_teams_balanced(people, teams):
+    names = [f"p{i}" for i in range(people)]
+    result = split_teams(names, teams, random.Random(people))
+    sizes = [len(t) for t in result]
+    assert len(result) == teams
+    assert max(sizes) - min(sizes) <= 1
+    assert sorted(n for t in result for n in t) == sorted(names)
+
+
+# ===== 抽選履歴 =====
+
+def test_draw_history_evicts_oldest(monkeypatch):
+    monkeypatch.setattr(rng, "DRAW_HISTORY", type(rng.DRAW_HISTORY)())
+    monkeypatch.setattr(rng, "DRAW_HISTORY_SIZE", 3)
+    for seed in range(5):
+        rng.record_draw(seed, "ban", count=2)
+    assert list(rng.DRAW_HISTORY) == [2, 3, 4]
+    assert rng.get_draw(0) is None
+    assert rng.get_draw(4) == ("ban", {"count": 2})
+
+
+# ===== スループット =====
+
+@pytest.mark.parametrize(
+    "picker",
+    [get_default_agents, get_chaos_agents, get_hirano_agents, lambda rng: get_ban_agents(2, rng)],
+)
+def test_selection_throughput(agent_file, picker):
+    """agents.json を毎回読むので、ファイル読み込み込みで 1 回あたり数 ms 以内に収まること。"""
+    n = 500
+    r = random.Random(0)
+    started = time.perf_counter()
+    for _ in range(n):
+        picker(r)
+    elapsed = time.perf_counter() - started
+    print(f"{n / elapsed:,.0f} draws/s")
+    assert elapsed / n < 0.005
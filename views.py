@@ -1,22 +1,74 @@
+import time
+import asyncio
+
 import discord
 from discord import ui
 
 from agents_data import get_default_agents, get_chaos_agents, get_hirano_agents
+from rng import new_seed, make_rng, record_draw
+from ledger import record_interaction
+from lifecycle import register_state, is_draining, begin_interaction, end_interaction, DRAINING_MESSAGE
+
+AGENT_SELECT_TIMEOUT = 180
+
+# 表示中のモード選択メッセージ（message_id -> 期限の epoch 秒）。再起動後にボタンを復元するのに使う
+LIVE_AGENT_SELECTS: dict[int, float] = {}
+
+# value -> (タイトル, 色, 抽選関数)
+AGENT_MODES = {
+    "1": ("デフォルトモード", discord.Color.blue, get_default_agents),
+    "2": ("カオスモード", discord.Color.red, get_chaos_agents),
+    "3": ("平野流モード", discord.Color.orange, get_hirano_agents),
+}
+
+
+def build_agent_embed(value: str, user_names: list[str], seed: int) -> discord.Embed | None:
+    """
+    モードと seed からエージェント構成の Embed を作る。
+    同じ seed・同じメンバーなら同じ構成になる（/va replay で使用）。
+    """
+    mode = AGENT_MODES.get(value)
+    if mode is None:
+        return None
+    mode_title, color, picker = mode
+    agents = picker(make_rng(seed))
+
+    # Embed 作成
+    embed = discord.Embed(
+        title=mode_title,
+        description=(
+            "ボイスチャンネルに 5 人以上いる場合は、その中から 5 人が自動で割り当てられます。\n"
+            "見る専の人がいる場合は、見る専の人が自分で指名してあげましょう！"
+        ),
+        color=color(),
+    )
+
+    for i, agent_name in enumerate(agents, start=1):
+        player_name = user_names[i - 1]
+        embed.add_field(name=player_name, value=agent_name, inline=False)
+
+    embed.set_footer(
+        text=f"注意：この構成は試合に勝つことを前提とした構成ではありません。 / seed: {seed}"
+    )
+    return embed
+
 
 # ===== エージェントモード選択ボタン =====
 
 class AgentSelectJa(discord.ui.Button):
     def __init__(self, label: str, value: str, parent_view: "AgentSelectViewJa"):
-        super().__init__(label=label, style=discord.ButtonStyle.primary)
+        super().__init__(label=label, style=discord.ButtonStyle.primary, custom_id=f"va_random:{value}")
         self.value = value
         self.parent_view = parent_view
 
     async def callback(self, interaction: discord.Interaction):
-        await interaction.response.defer()
+        try:
+            await self._select(interaction)
+        finally:
+            end_interaction(interaction.id)
 
-        agents = []
-        mode_title = ""
-        color = discord.Color.default()
+    async def _select(self, interaction: discord.Interaction):
+        await interaction.response.defer()
 
         # VC メンバー取得
         if interaction.user.voice and interaction.user.voice.channel:
@@ -30,40 +82,12 @@ class AgentSelectJa(discord.ui.Button):
         while len(user_names) < 5:
             user_names.append(f"Player{len(user_names) + 1}")
 
-        # モード振り分け
-        if self.value == "1":
-            agents = get_default_agents()
-            mode_title = "デフォルトモード"
-            color = discord.Color.blue()
-        elif self.value == "2":
-            agents = get_chaos_agents()
-            mode_title = "カオスモード"
-            color = discord.Color.red()
-        elif self.value == "3":
-            agents = get_hirano_agents()
-            mode_title = "平野流モード"
-            color = discord.Color.orange()
-        else:
+        seed = new_seed()
+        embed = build_agent_embed(self.value, user_names, seed)
+        if embed is None:
             await interaction.followup.send("無効なモードが選択されました。")
             return
-
-        # Embed 作成
-        embed = discord.Embed(
-            title=mode_title,
-            description=(
-                "ボイスチャンネルに 5 人以上いる場合は、その中から 5 人が自動で割り当てられます。\n"
-                "見る専の人がいる場合は、見る専の人が自分で指名してあげましょう！"
-            ),
-            color=color,
-        )
-
-        for i, agent_name in enumerate(agents, start=1):
-            player_name = user_names[i - 1]
-            embed.add_field(name=player_name, value=agent_name, inline=False)
-
-        embed.set_footer(
-            text="注意：この構成は試合に勝つことを前提とした構成ではありません。"
-        )
+        record_draw(seed, "random", mode=self.value, user_names=user_names)
 
         # ボタン無効化
         for item in self.parent_view.children:
@@ -78,11 +102,63 @@ class AgentSelectJa(discord.ui.Button):
             )
         except Exception as e:
             print(f"Error updating message: {e}")
+            record_interaction(interaction, "va random/button", ok=False)
+            return
+        LIVE_AGENT_SELECTS.pop(interaction.message.id, None)
+        self.parent_view.stop()
+        record_interaction(interaction, "va random/button", ok=True)
 
 
 class AgentSelectViewJa(discord.ui.View):
-    def __init__(self, timeout: float | None = 180):
+    def __init__(self, timeout: float | None = AGENT_SELECT_TIMEOUT):
         super().__init__(timeout=timeout)
         self.add_item(AgentSelectJa("デフォルト", "1", self))
         self.add_item(AgentSelectJa("カオス", "2", self))
         self.add_item(AgentSelectJa("平野流", "3", self))
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if is_draining():
+            await interaction.response.send_message(DRAINING_MESSAGE, ephemeral=True)
+            return False
+        begin_interaction(interaction.id)
+        return True
+
+
+def track_agent_select(message_id: int) -> None:
+    """送信したモード選択メッセージを記録する（再起動後の復元用）。期限切れはここで捨てる。"""
+    now = time.time()
+    for expired in [k for k, v in LIVE_AGENT_SELECTS.items() if v <= now]:
+        del LIVE_AGENT_SELECTS[expired]
+    LIVE_AGENT_SELECTS[message_id] = now + AGENT_SELECT_TIMEOUT
+
+
+def restore_agent_selects(bot: discord.Client) -> int:
+    """
+    再起動前に表示していたモード選択ボタンを、残り時間だけ再び押せるようにする。
+    add_view には timeout なしの View が必要なので、期限は call_later で止める。
+    """
+    now = time.time()
+    loop = asyncio.get_running_loop()
+    restored = 0
+    for message_id, expires_at in list(LIVE_AGENT_SELECTS.items()):
+        remaining = expires_at - now
+        if remaining <= 0:
+            del LIVE_AGENT_SELECTS[message_id]
+            continue
+        view = AgentSelectViewJa(timeout=None)
+        bot.add_view(view, message_id=message_id)
+        loop.call_later(remaining, view.stop)
+        restored += 1
+    return restored
+
+
+def _dump_agent_selects() -> dict[str, float]:
+    now = time.time()
+    return {str(k): v for k, v in LIVE_AGENT_SELECTS.items() if v > now}
+
+
+def _load_agent_selects(data: dict[str, float]) -> None:
+    LIVE_AGENT_SELECTS.update({int(k): float(v) for k, v in data.items()})
+
+
+register_state("agent_selects", _dump_agent_selects, _load_agent_selects)